@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # 注册信号
+        from api import signals
+        # 建立 sqlite 连接时执行 PRAGMA
+        from utils import db
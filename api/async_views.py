@@ -0,0 +1,65 @@
+"""
+只读图书接口的异步版本  需要 Django 3.1 以上并通过 asgi.py 部署
+
+查询与序列化在线程池中执行  事件循环可以同时持有大量慢速的连接
+响应由 APIResponse 生成  与同步的接口格式一致
+"""
+from asgiref.sync import sync_to_async
+from rest_framework import status
+
+from api.models import Book
+from api.serializers import BookModelSerializer, BookModelSerializerV2
+from utils.media import serve_media
+from utils.response import APIResponse
+from utils.timing import TimedJSONRenderer
+from utils.values_serializer import ValuesSerializer
+
+
+def api_response(**kwargs):
+    """
+    参数与 APIResponse 相同
+    不经过 DRF 的视图  没有内容协商  使用默认的 JSON 渲染器渲染
+    """
+    response = APIResponse(**kwargs)
+    response.accepted_renderer = TimedJSONRenderer()
+    response.accepted_media_type = response.accepted_renderer.media_type
+    response.renderer_context = {}
+    return response.render()
+
+
+def _serialize(serializer_class, queryset):
+    # 在线程池中执行  ORM 不能在事件循环中直接调用
+    return ValuesSerializer(serializer_class).serialize(queryset)
+
+
+async def serialize(serializer_class, queryset):
+    return await sync_to_async(_serialize)(serializer_class, queryset)
+
+
+async def book_list(request):
+    results = await serialize(BookModelSerializer, Book.alive.all())
+    return api_response(results=results, data_message="查询所有图书成功")
+
+
+async def book_detail(request, id):
+    results = await serialize(BookModelSerializer, Book.alive.filter(pk=id))
+    if not results:
+        return api_response(data_status=status.HTTP_400_BAD_REQUEST, data_message="图书不存在")
+    return api_response(results=results[0], data_message="查询单个图书成功")
+
+
+async def book_list_v2(request):
+    results = await serialize(BookModelSerializerV2, Book.alive.all())
+    return api_response(results=results)
+
+
+async def book_detail_v2(request, id):
+    results = await serialize(BookModelSerializerV2, Book.alive.filter(pk=id))
+    if not results:
+        return api_response(data_status=status.HTTP_400_BAD_REQUEST, data_message="图书不存在")
+    return api_response(results=results[0])
+
+
+async def media(request, path, document_root=None):
+    # 打开文件、判断条件请求等阻塞的操作放到线程池中
+    return await sync_to_async(serve_media)(request, path, document_root)
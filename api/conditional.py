@@ -0,0 +1,51 @@
+"""
+条件请求(ETag / Last-Modified)
+
+根据相关表的版本号生成 ETag  客户端携带 If-None-Match / If-Modified-Since
+且数据没有变化时直接返回 304  不执行查询也不序列化
+
+ETag 是主要的校验值  同时携带两个头时只比较 If-None-Match
+Last-Modified 只精确到秒  同一秒内的多次修改无法区分
+    数据在当前这一秒内修改过时不返回 Last-Modified  也不按 If-Modified-Since 返回 304
+    客户端拿到的 Last-Modified 之后的修改一定在更晚的秒内
+"""
+import hashlib
+import time
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from api.models import Book, Press, Author, AuthorDetail, DataVersion
+
+
+class ConditionalGetMixin(object):
+    # 响应内容所依赖的模型  任何一张表变化都会使 ETag 改变
+    version_models = (Book, Press, Author, AuthorDetail)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET":
+            return super().dispatch(request, *args, **kwargs)
+
+        versions, update_time = DataVersion.current(self.version_models)
+        # 不同的 Accept 会得到不同格式的响应  需要区分
+        accept = hashlib.md5(request.META.get("HTTP_ACCEPT", "").encode()).hexdigest()[:8]
+        etag = quote_etag("%s-%s" % (".".join(str(version) for version in versions), accept))
+        last_modified = int(update_time.timestamp()) if update_time else None
+        # 同一秒内之后还可能有修改  只使用 ETag
+        if last_modified is not None and last_modified >= int(time.time()):
+            last_modified = None
+
+        # 响应缓存的键中带上版本  其他进程修改数据后缓存也会失效
+        request.data_version = etag
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Accept",))
+        return response
@@ -0,0 +1,35 @@
+from api.listing import listing_filter_fields
+from api.models import BookListing
+from utils.filters import IndexedFilterBackend, IndexedOrderingFilter
+
+
+class BookFilterMixin(object):
+    """
+    图书列表的过滤与排序  所有字段都有对应的索引(见 Book.Meta.indexes)
+    ?price_min=10&price_max=50&publish=1,2&author=3&status=true
+    &created_after=2020-01-01&created_before=2021-01-01&ordering=-price
+    没有按主键顺序的索引(按 id 排序总是需要临时排序)  不支持 ordering=id
+    """
+    filter_backends = (IndexedFilterBackend, IndexedOrderingFilter)
+    filter_fields = {
+        "price_min": "price__gte",
+        "price_max": "price__lte",
+        "publish": "publish__in",
+        "author": "authors__in",
+        "status": "status",
+        "created_after": "create_time__gte",
+        "created_before": "create_time__lt",
+    }
+    ordering_fields = ("create_time", "price")
+
+    def get_filter_fields(self, model):
+        # 读模型(?source=listing)不支持按作者过滤
+        if model is BookListing:
+            return listing_filter_fields(self.filter_fields)
+        return self.filter_fields
+
+    def filter_queryset(self, queryset):
+        # 与 GenericAPIView.filter_queryset 相同  APIView 中也可以使用
+        for backend in list(self.filter_backends):
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
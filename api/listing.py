@@ -0,0 +1,203 @@
+"""
+图书列表的读模型 bz_book_listing(BookListing) 的同步
+
+每本未删除的图书一行  出版社的名称/地址/图片与作者的名字/年龄/电话展开保存
+    图书、作者、作者详情变化  重新生成相关图书的行
+    出版社变化               直接更新该出版社所有图书行中的出版社列
+    图书删除或逻辑删除        删除对应的行
+由信号与群增/群改/群删同步更新  与数据在同一个事务中完成
+sqlite 中由一条 INSERT OR REPLACE ... SELECT 生成行  作者的 JSON 由 Python 的聚合函数生成  与 build_rows 的结果相同
+    写入的行数少于图书数量时(有已删除的图书)才执行 DELETE
+列表接口携带 ?source=listing 时从读模型查询  见 use_listing
+"""
+import json
+
+from django.db import connections, router, transaction
+from django.db.backends.signals import connection_created
+
+from api.models import Author, AuthorDetail, Book, BookListing, Press
+from utils.filters import indexed_fields
+
+# 每次同步的图书数量  IN 的参数个数不超过 sqlite 的限制
+BATCH_SIZE = 500
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def build_rows(ids):
+    """
+    return: 这些图书中未删除的图书对应的行(未保存)
+    使用 values() 查询  不创建图书、出版社与作者的模型对象
+    """
+    books = list(Book.alive.filter(pk__in=ids).values(
+        "pk", "book_name", "price", "pic", "status", "create_time", "publish_id"))
+    # 外键没有约束  出版社可能已经不存在  单独查询(INNER JOIN 会漏掉图书)
+    presses = {press["pk"]: press for press in Press.objects.filter(
+        pk__in={book["publish_id"] for book in books}).values("pk", "press_name", "address", "pic")}
+    # 与 Book.author_list 的内容和顺序相同
+    authors = {}
+    through = Book.authors.through
+    for book_id, author_name, age, phone in through.objects.filter(
+            book_id__in=[book["pk"] for book in books]).order_by("book_id", "author_id").values_list(
+            "book_id", "author__author_name", "author__age", "author__detail__phone"):
+        authors.setdefault(book_id, []).append({"author_name": author_name, "age": age, "detail__phone": phone})
+
+    rows = []
+    for book in books:
+        press = presses.get(book["publish_id"], {})
+        rows.append(BookListing(
+            id=book["pk"],
+            book_name=book["book_name"],
+            price=book["price"],
+            pic=book["pic"],
+            status=book["status"],
+            create_time=book["create_time"],
+            publish_id=book["publish_id"],
+            press_name=press.get("press_name", ""),
+            press_address=press.get("address", ""),
+            press_pic=press.get("pic", ""),
+            authors=json.dumps(authors.get(book["pk"], []), ensure_ascii=False),
+        ))
+    return rows
+
+
+class AuthorsAggregate(object):
+    """
+    listing_authors(author_id, author_name, age, phone)  与 Book.author_list 的内容和顺序相同
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def step(self, author_id, author_name, age, phone):
+        self.rows.append((author_id, author_name, age, phone))
+
+    def finalize(self):
+        return json.dumps([{"author_name": author_name, "age": age, "detail__phone": phone}
+                           for _, author_name, age, phone in sorted(self.rows, key=lambda row: row[0])],
+                          ensure_ascii=False)
+
+
+def register_aggregate(sender, connection, **kwargs):
+    # 连接上有未结束的语句时不能注册函数  建立连接时注册
+    if connection.vendor == "sqlite":
+        connection.connection.create_aggregate("listing_authors", 4, AuthorsAggregate)
+
+
+connection_created.connect(register_aggregate, dispatch_uid="api.listing.register_aggregate")
+
+
+def _replace_rows(connection, batch):
+    """
+    sqlite: 一条 INSERT OR REPLACE ... SELECT 生成这些图书中未删除的图书的行
+    return: 写入的行数
+    """
+    through = Book.authors.through
+    columns = [field.column for field in BookListing._meta.concrete_fields]
+    sql = (
+        "INSERT OR REPLACE INTO {listing} ({columns}) "
+        "SELECT b.id, b.book_name, b.price, b.pic, b.status, b.create_time, b.publish_id, "
+        "COALESCE(p.press_name, ''), COALESCE(p.address, ''), COALESCE(p.pic, ''), "
+        # 没有作者时聚合函数返回 NULL
+        "COALESCE((SELECT listing_authors(a.id, a.author_name, a.age, d.phone) FROM {through} ba "
+        "JOIN {author} a ON a.id = ba.author_id LEFT JOIN {detail} d ON d.author_id = a.id "
+        "WHERE ba.book_id = b.id), '[]') "
+        "FROM {book} b LEFT JOIN {press} p ON p.id = b.publish_id "
+        "WHERE b.is_delete = 0 AND b.id IN ({placeholders})"
+    ).format(listing=BookListing._meta.db_table, columns=", ".join(columns), through=through._meta.db_table,
+             author=Author._meta.db_table, detail=AuthorDetail._meta.db_table, book=Book._meta.db_table,
+             press=Press._meta.db_table, placeholders=", ".join(["%s"] * len(batch)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, batch)
+        return cursor.rowcount
+
+
+def sync_books(ids):
+    """
+    重新生成这些图书的行  已删除的图书只删除
+    """
+    connection = connections[router.db_for_write(BookListing)]
+    sqlite = connection.vendor == "sqlite"
+    for batch in _batches(ids):
+        if sqlite:
+            if _replace_rows(connection, batch) < len(set(batch)):
+                BookListing.objects.filter(pk__in=batch).exclude(pk__in=Book.alive.filter(pk__in=batch).values("pk")).delete()
+        else:
+            rows = build_rows(batch)
+            BookListing.objects.filter(pk__in=batch).delete()
+            BookListing.objects.bulk_create(rows)
+
+
+def remove_books(ids):
+    for batch in _batches(ids):
+        BookListing.objects.filter(pk__in=batch).delete()
+
+
+def update_press(press):
+    # 出版社的图书可能很多  一条 UPDATE 修改所有行中的出版社列
+    BookListing.objects.filter(publish_id=press.pk).update(
+        press_name=press.press_name, press_address=press.address, press_pic=press.pic.name)
+
+
+def sync_author(author_id):
+    through = Book.authors.through
+    sync_books(through.objects.filter(author_id=author_id).values_list("book_id", flat=True))
+
+
+def alive_ids():
+    return Book.alive.order_by("pk").values_list("pk", flat=True)
+
+
+def rebuild():
+    """
+    return: 生成的行数
+    """
+    with transaction.atomic():
+        BookListing.objects.all().delete()
+        ids = list(alive_ids())
+        for batch in _batches(ids):
+            BookListing.objects.bulk_create(build_rows(batch))
+    return len(ids)
+
+
+def _values(row):
+    return tuple(field.value_from_object(row) for field in BookListing._meta.concrete_fields)
+
+
+def verify():
+    """
+    比较读模型与图书表
+    return: {"missing": 缺少的图书, "stale": 数据过期的图书, "extra": 多余的行}  主键列表
+    """
+    ids = list(alive_ids())
+    missing, stale = [], []
+    for batch in _batches(ids):
+        stored = BookListing.objects.in_bulk(batch)
+        for row in build_rows(batch):
+            if row.pk not in stored:
+                missing.append(row.pk)
+            elif _values(stored[row.pk]) != _values(row):
+                stale.append(row.pk)
+    extra = sorted(set(BookListing.objects.values_list("pk", flat=True)) - set(ids))
+    return {"missing": missing, "stale": stale, "extra": extra}
+
+
+def use_listing(request, view=None):
+    """
+    ?source=listing 并且读模型支持请求中所有的过滤参数(不支持按作者过滤)
+    """
+    if request.query_params.get("source") != "listing":
+        return False
+    filter_fields = getattr(view, "filter_fields", {})
+    supported = listing_filter_fields(filter_fields)
+    return not any(request.query_params.get(param) for param in filter_fields if param not in supported)
+
+
+def listing_filter_fields(filter_fields):
+    # 读模型中没有多对多关系  只保留读模型中有索引的字段
+    names = indexed_fields(BookListing)
+    return {param: lookup for param, lookup in filter_fields.items() if lookup.split("__")[0] in names}
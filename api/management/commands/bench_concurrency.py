@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand
+
+from utils.stats import percentile
+
+
+class Command(BaseCommand):
+    help = """
+    并发压测一个已经启动的服务  比较 WSGI 与 ASGI 部署的并发能力
+        gunicorn drf_day3.wsgi -w 2 -b :8000
+        uvicorn drf_day3.asgi:application --workers 2 --port 8001
+        python manage.py bench_concurrency http://127.0.0.1:8000/api/v2/books/ http://127.0.0.1:8001/api/async/v2/books/
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="要压测的地址  可以传递多个进行比较")
+        parser.add_argument("--concurrency", type=int, default=50, help="同时发起请求的客户端数量")
+        parser.add_argument("--requests", type=int, default=500, help="每个地址的总请求数")
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument("--json", action="store_true", help="以 json 格式输出结果")
+
+    def run(self, url, concurrency, total, timeout):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        counter = iter(range(total))
+
+        def worker():
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                start = time.perf_counter()
+                try:
+                    with urlopen(url, timeout=timeout) as response:
+                        response.read()
+                except (URLError, OSError):
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            "url": url,
+            "concurrency": concurrency,
+            "requests": total,
+            "errors": errors[0],
+            "seconds": round(elapsed, 3),
+            "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        }
+
+    def handle(self, *args, **options):
+        results = [self.run(url, options["concurrency"], options["requests"], options["timeout"])
+                   for url in options["urls"]]
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write("%(url)s  并发 %(concurrency)s  请求 %(requests)s  失败 %(errors)s  "
+                              "%(rps)s 次/秒  p50 %(p50_ms)sms  p95 %(p95_ms)sms  p99 %(p99_ms)sms" % result)
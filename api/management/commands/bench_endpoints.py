@@ -0,0 +1,147 @@
+import json
+import platform
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import urls as api_urls
+from api.models import Book
+from api.seeding import seed_catalog
+from day4 import urls as day4_urls
+from utils.cache import get_response_cache
+from utils.stats import git_commit, percentile
+
+
+class Command(BaseCommand):
+    help = """
+    接口性能基准测试  在临时的测试数据库中生成数据  通过测试客户端请求 api 与 day4 的所有路由
+    记录每个接口的延迟分位数、查询次数与内存峰值
+        python manage.py bench_endpoints --books 5000 --output bench.json
+        python manage.py bench_endpoints --books 5000 --compare bench.json
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=2000)
+        parser.add_argument("--presses", type=int, default=50)
+        parser.add_argument("--authors", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20, help="每个接口请求的次数")
+        parser.add_argument("--warm", action="store_true", help="不清空响应缓存")
+        parser.add_argument("--output", help="报告保存的路径  默认输出到控制台")
+        parser.add_argument("--compare", help="与之前的报告比较  输出变化")
+
+    def routes(self, book_id):
+        for prefix, module in (("/api/", api_urls), ("/day4/", day4_urls)):
+            for pattern in module.urlpatterns:
+                route = prefix + str(pattern.pattern)
+                yield route, route.replace("<str:id>", str(book_id))
+
+    def request(self, client, url):
+        if not self.options["warm"]:
+            get_response_cache().invalidate()
+        response = client.get(url)
+        # 流式响应需要读取完内容
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, len(content)
+
+    def measure(self, client, url):
+        repeat = self.options["repeat"]
+        try:
+            status, size = self.request(client, url)
+        except Exception as exc:
+            # 测试客户端会抛出视图中没有被处理的异常  记录异常  不影响其他接口
+            return {"status": "error", "error": "%s: %s" % (type(exc).__name__, exc)}
+
+        # 测试客户端在请求开始时会清空 connection.queries  通过 execute_wrapper 计数
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            self.request(client, url)
+
+        tracemalloc.start()
+        self.request(client, url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self.request(client, url)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        return {
+            "status": status,
+            "bytes": size,
+            "queries": len(queries),
+            "peak_kb": round(peak / 1024, 1),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+        }
+
+    def handle(self, *args, **options):
+        self.options = options
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = seed_catalog(books=options["books"], presses=options["presses"],
+                                   authors=options["authors"], seed=options["seed"])
+            book_id = Book.alive.order_by("pk").values_list("pk", flat=True).first()
+
+            client = Client()
+            endpoints = {}
+            for route, url in self.routes(book_id):
+                endpoints[route] = self.measure(client, url)
+                self.stderr.write("%s %s" % (route, endpoints[route]))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "repeat": options["repeat"],
+                "warm": options["warm"],
+                "dataset": dataset,
+            },
+            "endpoints": endpoints,
+        }
+        content = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(content + "\n")
+        else:
+            self.stdout.write(content)
+
+        if options["compare"]:
+            self.compare(options["compare"], report)
+
+    def compare(self, path, report):
+        with open(path) as f:
+            old = json.load(f)
+        for route, current in sorted(report["endpoints"].items()):
+            before = old["endpoints"].get(route)
+            if before is None:
+                self.stdout.write("%s  新增" % route)
+                continue
+            changes = []
+            if "error" in before or "error" in current:
+                self.stdout.write("%s  %s -> %s" % (route, before["status"], current["status"]))
+                continue
+            for key in ("queries", "p50_ms", "p95_ms", "peak_kb", "bytes"):
+                if before[key] != current[key]:
+                    ratio = "%+.0f%%" % ((current[key] - before[key]) * 100.0 / before[key]) if before[key] else ""
+                    changes.append("%s %s -> %s %s" % (key, before[key], current[key], ratio))
+            self.stdout.write("%s  %s" % (route, "; ".join(changes) or "无变化"))
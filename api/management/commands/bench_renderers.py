@@ -0,0 +1,105 @@
+import json
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils.text import compress_string
+
+from api.models import Book
+from api.seeding import seed_catalog
+from api.serializers import BookModelSerializer
+from utils.compression import brotli
+from utils.renderers import ColumnarJSONRenderer, MessagePackRenderer, msgpack
+from utils.stats import git_commit, percentile
+from utils.timing import TimedJSONRenderer
+from utils.values_serializer import ValuesSerializer
+
+
+class Command(BaseCommand):
+    help = """
+    比较各个响应格式与压缩方式的编码耗时与大小  以默认的 JSON 为基准
+    在临时的测试数据库中生成数据  渲染 /api/books/ 的图书列表
+        python manage.py bench_renderers --books 5000 --output renderers.json
+    没有安装 msgpack / brotli 时跳过对应的格式
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=2000)
+        parser.add_argument("--presses", type=int, default=50)
+        parser.add_argument("--authors", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20, help="每种格式编码的次数")
+        parser.add_argument("--output", help="报告保存的路径  默认输出到控制台")
+
+    def timed(self, func, *args):
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            result = func(*args)
+            timings.append((time.perf_counter() - start) * 1000)
+        return result, round(percentile(timings, 50), 3)
+
+    def renderers(self):
+        yield "json", TimedJSONRenderer()
+        yield "columnar", ColumnarJSONRenderer()
+        if msgpack is not None:
+            yield "msgpack", MessagePackRenderer()
+
+    def encodings(self):
+        yield "gzip", compress_string
+        if brotli is not None:
+            yield "br", lambda content: brotli.compress(content, quality=settings.BROTLI_QUALITY)
+
+    def handle(self, *args, **options):
+        self.repeat = options["repeat"]
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = seed_catalog(books=options["books"], presses=options["presses"],
+                                   authors=options["authors"], seed=options["seed"])
+            # 与 APIResponse 的结构相同
+            data = {"status": 200, "message": 0,
+                    "results": ValuesSerializer(BookModelSerializer).serialize(Book.alive.all())}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        formats = {}
+        for name, renderer in self.renderers():
+            content, encode_ms = self.timed(renderer.render, data, renderer.media_type, {})
+            result = {"media_type": renderer.media_type, "bytes": len(content), "encode_ms": encode_ms}
+            for encoding, compress in self.encodings():
+                compressed, compress_ms = self.timed(compress, content)
+                result[encoding] = {"bytes": len(compressed), "compress_ms": compress_ms}
+            formats[name] = result
+
+        # 相对于 JSON 的大小与耗时
+        base = formats["json"]
+        for name, result in sorted(formats.items()):
+            line = "%-9s %9d B (%5.1f%%)  %8.3f ms (%5.1f%%)" % (
+                name, result["bytes"], result["bytes"] * 100.0 / base["bytes"],
+                result["encode_ms"], result["encode_ms"] * 100.0 / base["encode_ms"] if base["encode_ms"] else 0)
+            for encoding, _ in self.encodings():
+                line += "  %s %d B %.3f ms" % (encoding, result[encoding]["bytes"], result[encoding]["compress_ms"])
+            self.stderr.write(line)
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "repeat": self.repeat,
+                "dataset": dataset,
+            },
+            "formats": formats,
+        }
+        content = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(content + "\n")
+        else:
+            self.stdout.write(content)
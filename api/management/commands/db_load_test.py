@@ -0,0 +1,91 @@
+import json
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+
+from api.models import Book
+from utils.stats import percentile
+
+
+class Command(BaseCommand):
+    help = """
+    数据库并发读写压测  分别使用两种配置运行后比较结果(请使用数据库的副本)
+        DB_PROFILE=default python manage.py db_load_test
+        DB_PROFILE=sqlite_tuned python manage.py db_load_test
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8, help="读线程数")
+        parser.add_argument("--writers", type=int, default=2, help="写线程数")
+        parser.add_argument("--seconds", type=float, default=10, help="压测时间")
+        parser.add_argument("--json", action="store_true", help="以 json 格式输出结果")
+
+    def handle(self, *args, **options):
+        ids = list(Book.objects.values_list("pk", flat=True)[:1000])
+        if not ids:
+            raise CommandError("数据库中没有图书  请先生成测试数据")
+        journal_mode = None
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = cursor.fetchone()[0]
+        connection.close()
+
+        deadline = time.monotonic() + options["seconds"]
+        stats = {"read": ([], [0]), "write": ([], [0])}
+        lock = threading.Lock()
+
+        def read():
+            list(Book.alive.values("id", "book_name", "price")[:50])
+
+        def write():
+            # 写入与原来相同的值  不改变数据  但会获取写锁
+            with transaction.atomic():
+                Book.objects.filter(pk=random.choice(ids)).update(price=F("price"))
+
+        def worker(role, operation):
+            latencies, errors = stats[role]
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        operation()
+                    except OperationalError:
+                        # database is locked
+                        with lock:
+                            errors[0] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=("read", read)) for _ in range(options["readers"])]
+        threads += [threading.Thread(target=worker, args=("write", write)) for _ in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        report = {"profile": settings.DB_PROFILE, "journal_mode": journal_mode, "seconds": options["seconds"]}
+        for role, (latencies, errors) in stats.items():
+            report[role] = {
+                "ops": len(latencies),
+                "ops_per_second": round(len(latencies) / options["seconds"], 1),
+                "errors": errors[0],
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write("配置 %(profile)s  journal_mode=%(journal_mode)s" % report)
+        for role in ("read", "write"):
+            self.stdout.write("%s: %s" % (role, report[role]))
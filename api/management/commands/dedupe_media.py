@@ -0,0 +1,44 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import listing
+from api.models import Book, Press, DataVersion
+from utils.storage import default_names, is_hashed_name, media_storage
+
+
+class Command(BaseCommand):
+    help = "将已有的图片迁移为按内容命名的文件  内容相同的图片只保留一份"
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Book, Press):
+            names.update(model.objects.exclude(pic="").values_list("pic", flat=True).distinct())
+
+        # 默认图片由新增的数据共用  不迁移
+        names -= default_names(Book, Press)
+
+        moved = 0
+        for name in sorted(names):
+            if is_hashed_name(name) or not media_storage.exists(name):
+                continue
+            with media_storage.open(name, "rb") as f:
+                new_name = media_storage.save(name, File(f, name))
+            with transaction.atomic():
+                book_ids = list(Book.objects.filter(pic=name).values_list("pk", flat=True))
+                presses = list(Press.objects.filter(pic=name))
+                for model in (Book, Press):
+                    model.objects.filter(pic=name).update(pic=new_name)
+                # update() 不会触发信号  同步读模型中的图片
+                listing.sync_books(book_ids)
+                for press in presses:
+                    press.pic = new_name
+                    listing.update_press(press)
+            # 原文件不是按内容命名的  直接删除
+            media_storage.delete(name)
+            self.stdout.write("%s -> %s" % (name, new_name))
+            moved += 1
+        if moved:
+            # update() 不会触发信号  手动更新版本
+            DataVersion.bump(Book, Press)
+        self.stdout.write("迁移了 %s 个文件" % moved)
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seeding import CHUNK_SIZE, clear_catalog, make_placeholders, seed_catalog
+from utils.renditions import generate_renditions
+from utils.storage import media_storage
+
+
+class Command(BaseCommand):
+    help = """
+    生成大量的测试数据  相同的参数与 seed 生成相同的数据
+        python manage.py generate_dataset --books 1000000 --presses 500 --authors 50000 \\
+            --press-skew 1.1 --author-skew 0.8 --images 20 --clear
+    建议配合 DB_PROFILE=sqlite_tuned 使用
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100000)
+        parser.add_argument("--presses", type=int, default=200)
+        parser.add_argument("--authors", type=int, default=10000)
+        parser.add_argument("--authors-per-book", type=int, default=3, help="每本图书最多的作者数量")
+        parser.add_argument("--press-skew", type=float, default=1.0, help="出版社的倾斜程度  0 为均匀分布")
+        parser.add_argument("--author-skew", type=float, default=0.8, help="作者的倾斜程度  0 为均匀分布")
+        parser.add_argument("--deleted", type=float, default=0.02, help="逻辑删除的图书比例")
+        parser.add_argument("--images", type=int, default=0, help="生成的占位图片数量  0 为使用默认图片")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每个事务插入的图书数量")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clear", action="store_true", help="生成之前清空已有的数据")
+
+    def handle(self, *args, **options):
+        if options["authors_per_book"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--authors-per-book 与 --chunk-size 必须大于 0")
+        if not 0 <= options["deleted"] <= 1:
+            raise CommandError("--deleted 必须在 0 ~ 1 之间")
+        if options["books"] and options["presses"] < 1:
+            raise CommandError("生成图书至少需要 1 个出版社(--presses)")
+        if min(options["books"], options["presses"], options["authors"]) < 0:
+            raise CommandError("--books / --presses / --authors 不能小于 0")
+
+        if options["clear"]:
+            clear_catalog()
+
+        pics = None
+        if options["images"]:
+            try:
+                pics = make_placeholders(options["images"], media_storage, seed=options["seed"])
+            except ImportError:
+                raise CommandError("生成图片需要安装 Pillow")
+            # 图片数量很少  直接生成缩略图
+            for name in pics:
+                generate_renditions(media_storage, name)
+
+        start = time.perf_counter()
+
+        def progress(done, total):
+            elapsed = time.perf_counter() - start
+            self.stderr.write("%s / %s  %.1fs  %.0f 本/秒" % (done, total, elapsed, done / elapsed))
+
+        counts = seed_catalog(
+            books=options["books"], presses=options["presses"], authors=options["authors"],
+            authors_per_book=options["authors_per_book"], seed=options["seed"],
+            press_skew=options["press_skew"], author_skew=options["author_skew"],
+            deleted=options["deleted"], pics=pics, chunk_size=options["chunk_size"], progress=progress,
+        )
+        self.stdout.write("生成完成 %.1fs  %s" % (time.perf_counter() - start,
+                                                 "  ".join("%s: %s" % item for item in counts.items())))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Book, Press
+from utils.renditions import generate_renditions, get_renditions, is_ready, rendition_name
+
+
+class Command(BaseCommand):
+    help = "为已有的图书与出版社图片生成缩略图"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="重新生成已经存在的缩略图")
+
+    def handle(self, *args, **options):
+        generated = skipped = 0
+        for model in (Book, Press):
+            storage = model._meta.get_field("pic").storage
+            names = model.objects.exclude(pic="").values_list("pic", flat=True).distinct()
+            for name in names.iterator():
+                if not storage.exists(name):
+                    self.stderr.write("图片不存在: %s" % name)
+                    continue
+                if not options["force"] and all(is_ready(storage, rendition_name(name, rendition))
+                                                 for rendition in get_renditions()):
+                    skipped += 1
+                    continue
+                generate_renditions(storage, name)
+                generated += 1
+        self.stdout.write("生成 %s 张  跳过 %s 张" % (generated, skipped))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import listing
+
+
+class Command(BaseCommand):
+    help = """
+    重新生成图书列表的读模型 bz_book_listing
+        python manage.py rebuild_book_listing
+    只检查读模型与图书表是否一致  --repair 只重新生成不一致的图书
+        python manage.py rebuild_book_listing --verify [--repair]
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="只检查  不重新生成")
+        parser.add_argument("--repair", action="store_true", help="与 --verify 一起使用  修复不一致的图书")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not options["verify"]:
+            count = listing.rebuild()
+            self.stdout.write("生成 %s 本图书  %.1fs" % (count, time.perf_counter() - start))
+            return
+
+        result = listing.verify()
+        for key in ("missing", "stale", "extra"):
+            ids = result[key]
+            self.stdout.write("%s: %s %s" % (key, len(ids), ids[:20] if ids else ""))
+        broken = result["missing"] + result["stale"] + result["extra"]
+        if broken and options["repair"]:
+            listing.sync_books(broken)
+            self.stdout.write("修复 %s 本图书  %.1fs" % (len(broken), time.perf_counter() - start))
+        elif broken:
+            raise CommandError("读模型与图书表不一致  使用 --repair 修复或重新生成")
+        else:
+            self.stdout.write("一致  %.1fs" % (time.perf_counter() - start))
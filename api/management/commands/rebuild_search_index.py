@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "重新生成图书的全文索引(sqlite FTS5)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--optimize", action="store_true", help="重建之后合并索引")
+
+    def handle(self, *args, **options):
+        connection = search.get_connection()
+        if not search.is_enabled(connection):
+            raise CommandError("全文索引只支持 sqlite")
+        start = time.perf_counter()
+        with transaction.atomic(using=connection.alias):
+            count = search.rebuild(connection)
+        if options["optimize"]:
+            search.optimize(connection)
+        self.stdout.write("索引 %s 本图书  %.1fs" % (count, time.perf_counter() - start))
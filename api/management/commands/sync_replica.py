@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = """
+    本地测试读写分离：使用 sqlite 的在线备份将主库复制到从库
+        DB_REPLICA=1 python manage.py sync_replica --interval 1
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0,
+                            help="每隔多少秒复制一次  默认只复制一次")
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if not replicas:
+            raise CommandError("没有配置从库  请设置环境变量 DB_REPLICA=1")
+        primary = connections["default"].settings_dict
+        if connections["default"].vendor != "sqlite":
+            raise CommandError("只支持 sqlite 数据库")
+
+        while True:
+            source = sqlite3.connect(primary["NAME"])
+            try:
+                for alias in replicas:
+                    target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write("已复制到 %s" % ", ".join(replicas))
+
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_delete', 'create_time', 'id'], name='bz_book_delete_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_delete', 'publish'], name='bz_book_delete_publish_idx'),
+        ),
+    ]
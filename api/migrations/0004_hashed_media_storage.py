@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:51
+
+from django.db import migrations, models
+import utils.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_book_soft_delete_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='pic',
+            field=models.ImageField(default='img/1.jpeg', storage=utils.storage.HashedFileSystemStorage(), upload_to='img'),
+        ),
+        migrations.AlterField(
+            model_name='press',
+            name='pic',
+            field=models.ImageField(default='img/1.jpeg', storage=utils.storage.HashedFileSystemStorage(), upload_to='img'),
+        ),
+    ]
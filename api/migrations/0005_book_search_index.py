@@ -0,0 +1,55 @@
+import re
+
+from django.db import migrations
+
+# 迁移时的全文索引  不依赖之后会修改的 api.search
+CJK_RE = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])")
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bz_book_search USING fts5("
+    "book_name, press_name, address, authors, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+BUILD_INDEX = (
+    "INSERT INTO bz_book_search(rowid, book_name, press_name, address, authors) "
+    "SELECT b.id, search_segment(b.book_name), search_segment(p.press_name), search_segment(p.address), "
+    "(SELECT search_segment(group_concat(a.author_name, ' ')) FROM bz_book_authors ba "
+    "JOIN bz_author a ON a.id = ba.author_id WHERE ba.book_id = b.id) "
+    "FROM bz_book b LEFT JOIN bz_press p ON p.id = b.publish_id "
+    "WHERE b.is_delete = 0"
+)
+
+
+def segment(text):
+    return CJK_RE.sub(r" \1 ", text or "")
+
+
+def create_search_index(apps, schema_editor):
+    # 只有 sqlite 使用 FTS5 建立全文索引
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    connection.ensure_connection()
+    connection.connection.create_function("search_segment", 1, segment)
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute("DELETE FROM bz_book_search")
+        cursor.execute(BUILD_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS bz_book_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_hashed_media_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
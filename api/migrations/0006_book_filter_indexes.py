@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_book_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='bz_book_delete_publish_idx',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_delete', 'publish', 'create_time', 'id'], name='bz_book_del_publish_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_delete', 'price', 'id'], name='bz_book_delete_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_delete', 'status', 'create_time', 'id'], name='bz_book_del_status_time_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:16
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+import utils.storage
+
+# 每批生成的图书数量  IN 的参数个数不超过 sqlite 的限制
+BATCH_SIZE = 500
+
+
+def build_listing(apps, schema_editor):
+    # 使用迁移中的历史模型与当前迁移的数据库  不依赖之后会修改的 api.listing
+    db = schema_editor.connection.alias
+    Book = apps.get_model("api", "Book")
+    Press = apps.get_model("api", "Press")
+    BookListing = apps.get_model("api", "BookListing")
+    through = Book.authors.through
+
+    ids = list(Book.objects.using(db).filter(is_delete=False).order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        books = list(Book.objects.using(db).filter(pk__in=batch).values(
+            "pk", "book_name", "price", "pic", "status", "create_time", "publish_id"))
+        presses = {press["pk"]: press for press in Press.objects.using(db).filter(
+            pk__in={book["publish_id"] for book in books}).values("pk", "press_name", "address", "pic")}
+        authors = {}
+        for book_id, author_name, age, phone in through.objects.using(db).filter(book_id__in=batch).order_by(
+                "book_id", "author_id").values_list("book_id", "author__author_name", "author__age",
+                                                    "author__detail__phone"):
+            authors.setdefault(book_id, []).append({"author_name": author_name, "age": age, "detail__phone": phone})
+
+        rows = []
+        for book in books:
+            press = presses.get(book["publish_id"], {})
+            rows.append(BookListing(
+                id=book["pk"],
+                book_name=book["book_name"],
+                price=book["price"],
+                pic=book["pic"],
+                status=book["status"],
+                create_time=book["create_time"],
+                publish_id=book["publish_id"],
+                press_name=press.get("press_name", ""),
+                press_address=press.get("address", ""),
+                press_pic=press.get("pic", ""),
+                authors=json.dumps(authors.get(book["pk"], []), ensure_ascii=False),
+            ))
+        BookListing.objects.using(db).bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_book_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookListing',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('book_name', models.CharField(max_length=128)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('pic', models.ImageField(storage=utils.storage.HashedFileSystemStorage(), upload_to='img')),
+                ('status', models.BooleanField(default=True)),
+                ('create_time', models.DateTimeField()),
+                ('press_name', models.CharField(max_length=128)),
+                ('press_address', models.CharField(max_length=256)),
+                ('press_pic', models.ImageField(storage=utils.storage.HashedFileSystemStorage(), upload_to='img')),
+                ('authors', models.TextField(default='[]')),
+                ('publish', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.Press')),
+            ],
+            options={
+                'verbose_name': '图书列表',
+                'verbose_name_plural': '图书列表',
+                'db_table': 'bz_book_listing',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='booklisting',
+            index=models.Index(fields=['create_time', 'id'], name='bz_listing_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booklisting',
+            index=models.Index(fields=['publish', 'create_time', 'id'], name='bz_listing_publish_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booklisting',
+            index=models.Index(fields=['price', 'id'], name='bz_listing_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booklisting',
+            index=models.Index(fields=['status', 'create_time', 'id'], name='bz_listing_status_time_idx'),
+        ),
+        migrations.RunPython(build_listing, migrations.RunPython.noop),
+    ]
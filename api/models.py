@@ -1,12 +1,48 @@
+import json
+
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from utils.storage import media_storage
+from utils.writes import record_write
 # Create your models here.
 
+# 未被删除的条件
+# Django 3.x 中 is_delete=False 生成 WHERE NOT "is_delete"  sqlite 不能使用以 is_delete 开头的组合索引
+# 使用 IN 生成 "is_delete" IN (0)  与 2.x 一样按索引等值查找
+ALIVE = {"is_delete__in": [False]}
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def alive(self):
+        # 未被删除的数据  见 ALIVE
+        return self.filter(**ALIVE)
+
+    def soft_delete(self):
+        # 逻辑删除  return: 删除的条数
+        return self.update(is_delete=True)
+
+
+class AliveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    只查询未被删除的数据  Model.alive.all()
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**ALIVE)
+
+
 # 抽象表 基表
 class BaseModel(models.Model):
     is_delete = models.BooleanField(default=False)
     create_time = models.DateTimeField(auto_now_add=True)
     status = models.BooleanField(default=True)
 
+    # 第一个管理器为默认管理器  admin 与关联查询仍然可以看到所有的数据
+    objects = SoftDeleteQuerySet.as_manager()
+    alive = AliveManager()
+
     class Meta:
         # 在元数据中一旦声明此属性后  不会在数据库中创建对应的表结构
         # 其他模型继承这个模型后  可以继承表中的字段
@@ -16,7 +52,7 @@ class BaseModel(models.Model):
 class Book(BaseModel):
     book_name = models.CharField(max_length=128)
     price = models.DecimalField(max_digits=5, decimal_places=2)
-    pic = models.ImageField(upload_to="img", default="img/1.jpeg")
+    pic = models.ImageField(upload_to="img", default="img/1.jpeg", storage=media_storage)
     publish = models.ForeignKey(to="Press",  # 关联表
                                 on_delete=models.CASCADE,  # 级联删除
                                 db_constraint=False,  # 删除后对应字段的值可以为空
@@ -27,6 +63,24 @@ class Book(BaseModel):
         db_table = "bz_book"
         verbose_name = "图书"
         verbose_name_plural = verbose_name
+        # 查询都会过滤 is_delete  组合索引以 is_delete 开头
+        indexes = [
+            # 查询未删除的图书并按创建时间排序/游标分页
+            models.Index(fields=["is_delete", "create_time", "id"], name="bz_book_delete_time_idx"),
+            # 查询某个出版社未删除的图书  按创建时间排序
+            models.Index(fields=["is_delete", "publish", "create_time", "id"], name="bz_book_del_publish_time_idx"),
+            # 按价格区间过滤/按价格排序
+            models.Index(fields=["is_delete", "price", "id"], name="bz_book_delete_price_idx"),
+            # 按状态过滤  按创建时间排序
+            models.Index(fields=["is_delete", "status", "create_time", "id"], name="bz_book_del_status_time_idx"),
+        ]
+
+    # 自定义属性所依赖的关联  供 utils.prefetch 自动添加关联加载
+    related_hints = {
+        "publish_name": ("publish",),
+        "press_address": ("publish",),
+        "author_list": ("authors__detail",),
+    }
 
     def __str__(self):
         return self.book_name
@@ -45,12 +99,19 @@ class Book(BaseModel):
 
     @property
     def author_list(self):
+        # 作者已经被预加载时直接使用缓存  不再为每本书单独查询
+        if "authors" in getattr(self, "_prefetched_objects_cache", {}):
+            return [{
+                "author_name": author.author_name,
+                "age": author.age,
+                "detail__phone": getattr(getattr(author, "detail", None), "phone", None),
+            } for author in self.authors.all()]
         return self.authors.values("author_name", "age", "detail__phone")
 
 
 class Press(BaseModel):
     press_name = models.CharField(max_length=128)
-    pic = models.ImageField(upload_to="img", default="img/1.jpeg")
+    pic = models.ImageField(upload_to="img", default="img/1.jpeg", storage=media_storage)
     address = models.CharField(max_length=256)
 
     class Meta:
@@ -86,3 +147,88 @@ class AuthorDetail(BaseModel):
 
     def __str__(self):
         return "%s的详情" % self.author.author_name
+
+
+class BookListing(models.Model):
+    """
+    图书列表的读模型  每本未删除的图书一行  出版社与作者的信息展开保存在同一行
+    列表查询一张表、一次索引扫描  不需要连接出版社、关系表、作者与作者详情
+    由 api.listing 在图书、出版社、作者、作者详情变化时同步  不直接修改
+    """
+    # 与图书的主键相同
+    id = models.IntegerField(primary_key=True)
+    book_name = models.CharField(max_length=128)
+    price = models.DecimalField(max_digits=5, decimal_places=2)
+    pic = models.ImageField(upload_to="img", storage=media_storage)
+    status = models.BooleanField(default=True)
+    create_time = models.DateTimeField()
+    # 索引见 bz_listing_publish_time_idx
+    publish = models.ForeignKey(to="Press", on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                related_name="+")
+    press_name = models.CharField(max_length=128)
+    press_address = models.CharField(max_length=256)
+    press_pic = models.ImageField(upload_to="img", storage=media_storage)
+    # 作者的名字、年龄与电话  json 格式  与 Book.author_list 相同
+    authors = models.TextField(default="[]")
+
+    class Meta:
+        db_table = "bz_book_listing"
+        verbose_name = "图书列表"
+        verbose_name_plural = verbose_name
+        # 与 Book 的索引相同  没有 is_delete 前缀
+        indexes = [
+            models.Index(fields=["create_time", "id"], name="bz_listing_time_idx"),
+            models.Index(fields=["publish", "create_time", "id"], name="bz_listing_publish_time_idx"),
+            models.Index(fields=["price", "id"], name="bz_listing_price_idx"),
+            models.Index(fields=["status", "create_time", "id"], name="bz_listing_status_time_idx"),
+        ]
+
+    def __str__(self):
+        return self.book_name
+
+    @property
+    def author_list(self):
+        return json.loads(self.authors)
+
+
+class DataVersion(models.Model):
+    """
+    每张表的数据版本  表中的数据发生变化后版本号加一
+    用于生成 ETag 与 Last-Modified  不需要重新序列化数据就能判断数据是否变化
+    """
+    table = models.CharField(max_length=64, unique=True)
+    version = models.BigIntegerField(default=0)
+    update_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "bz_data_version"
+        verbose_name = "数据版本"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return "%s:%s" % (self.table, self.version)
+
+    @classmethod
+    def bump(cls, *model_list):
+        """
+        增加模型对应表的版本号  并记录当前请求写入了这些表(utils.writes)
+        """
+        now = timezone.now()
+        for model in model_list:
+            table = model._meta.db_table
+            record_write(table)
+            updated = cls.objects.filter(table=table).update(version=F("version") + 1, update_time=now)
+            if not updated:
+                cls.objects.get_or_create(table=table, defaults={"version": 1, "update_time": now})
+
+    @classmethod
+    def current(cls, model_list):
+        """
+        查询多张表的版本  return: (版本号的列表, 最后修改的时间)
+        """
+        tables = [model._meta.db_table for model in model_list]
+        rows = dict((row[0], row[1:]) for row in
+                    cls.objects.filter(table__in=tables).values_list("table", "version", "update_time"))
+        versions = [rows.get(table, (0, None))[0] for table in tables]
+        times = [row[1] for row in rows.values()]
+        return versions, max(times) if times else None
@@ -0,0 +1,170 @@
+"""
+图书的全文检索  使用 sqlite 的 FTS5 虚拟表 bz_book_search
+
+每本未删除的图书一行  rowid 为图书的主键
+    book_name  图书名
+    press_name 出版社名
+    address    出版社地址
+    authors    所有作者的名字
+unicode61 分词器不会切分中文  写入与查询时在每个汉字的两边加上空格  按单字建立索引
+查询词作为短语匹配  "图书" -> "图 书"*  结果按 bm25 排序  图书名的权重最高  相关度相同时新的图书在前
+
+写入时由信号与群增/群改/群删同步更新  其他数据库没有这个表  所有的同步操作都不执行
+"""
+import re
+
+from django.db import connections, router
+
+from api.models import Author, Book, Press
+
+TABLE = "bz_book_search"
+# bm25 中 book_name / press_name / address / authors 的权重
+WEIGHTS = (10.0, 4.0, 1.0, 4.0)
+# 每条 SQL 中 IN 的参数个数  不超过 sqlite 的限制
+BATCH_SIZE = 500
+
+CJK_RE = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])")
+
+
+def segment(text):
+    """图书123 -> " 图  书 123" """
+    return CJK_RE.sub(r" \1 ", text or "")
+
+
+def build_query(query):
+    """
+    每个词作为一个短语  最后一个字允许前缀匹配  多个词之间为 AND
+    return: FTS5 的查询语句  没有有效的词时返回 None
+    """
+    phrases = []
+    for term in query.split():
+        tokens = segment(term).split()
+        if tokens:
+            phrases.append('"%s" *' % " ".join(tokens).replace('"', '""'))
+    return " AND ".join(phrases) or None
+
+
+def get_connection():
+    return connections[router.db_for_write(Book)]
+
+
+def is_enabled(connection=None):
+    return (connection or get_connection()).vendor == "sqlite"
+
+
+def _ensure_function(connection):
+    # 重建索引的 SQL 中使用 Python 的分词函数
+    connection.ensure_connection()
+    connection.connection.create_function("search_segment", 1, segment)
+
+
+def create_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+            "book_name, press_name, address, authors, tokenize = 'unicode61 remove_diacritics 2')" % TABLE
+        )
+
+
+def drop_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS %s" % TABLE)
+
+
+def _select_documents(where):
+    through = Book.authors.through
+    return (
+        "SELECT b.id, search_segment(b.book_name), search_segment(p.press_name), search_segment(p.address), "
+        "(SELECT search_segment(group_concat(a.author_name, ' ')) FROM {through} ba "
+        "JOIN {author} a ON a.id = ba.author_id WHERE ba.book_id = b.id) "
+        "FROM {book} b LEFT JOIN {press} p ON p.id = b.publish_id "
+        "WHERE b.is_delete = 0 AND {where}"
+    ).format(through=through._meta.db_table, author=Author._meta.db_table, book=Book._meta.db_table,
+             press=Press._meta.db_table, where=where)
+
+
+def rebuild(connection=None):
+    """
+    return: 索引的图书数量
+    """
+    connection = connection or get_connection()
+    if not is_enabled(connection):
+        return 0
+    _ensure_function(connection)
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s" % TABLE)
+        cursor.execute("INSERT INTO %s(rowid, book_name, press_name, address, authors) %s"
+                       % (TABLE, _select_documents("1 = 1")))
+        cursor.execute("SELECT count(*) FROM %s" % TABLE)
+        return cursor.fetchone()[0]
+
+
+def optimize(connection=None):
+    # 合并索引的 b-tree  大量写入之后执行
+    connection = connection or get_connection()
+    if is_enabled(connection):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO %s(%s) VALUES('optimize')" % (TABLE, TABLE))
+
+
+def index_books(ids):
+    """
+    重新生成这些图书的索引  已删除的图书会从索引中移除
+    INSERT OR REPLACE 覆盖原来的行  写入的行数少于图书数量时(有已删除的图书)才执行 DELETE
+    """
+    connection = get_connection()
+    ids = list(ids)
+    if not ids or not is_enabled(connection):
+        return
+    _ensure_function(connection)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute("INSERT OR REPLACE INTO %s(rowid, book_name, press_name, address, authors) %s"
+                           % (TABLE, _select_documents("b.id IN (%s)" % placeholders)), batch)
+            if cursor.rowcount < len(set(batch)):
+                cursor.execute("DELETE FROM %s WHERE rowid IN (%s) AND rowid NOT IN "
+                               "(SELECT id FROM %s WHERE is_delete = 0 AND id IN (%s))"
+                               % (TABLE, placeholders, Book._meta.db_table, placeholders), batch + batch)
+
+
+def remove_books(ids):
+    connection = get_connection()
+    ids = list(ids)
+    if not ids or not is_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            cursor.execute("DELETE FROM %s WHERE rowid IN (%s)" % (TABLE, ", ".join(["%s"] * len(batch))), batch)
+
+
+def update_press(press):
+    # 出版社的图书可能很多  直接更新索引中的列  不重新生成整行
+    connection = get_connection()
+    if not is_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE %s SET press_name = %%s, address = %%s WHERE rowid IN (SELECT id FROM %s WHERE publish_id = %%s)"
+            % (TABLE, Book._meta.db_table),
+            [segment(press.press_name), segment(press.address), press.pk],
+        )
+
+
+def search(query, offset=0, limit=20):
+    """
+    return: 按相关度排序的图书主键  查询语句无效时返回空列表
+    """
+    match = build_query(query)
+    connection = connections[router.db_for_read(Book)]
+    if match is None or not is_enabled(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rowid FROM %s WHERE %s MATCH %%s ORDER BY bm25(%s, %s), rowid DESC LIMIT %%s OFFSET %%s"
+            % (TABLE, TABLE, TABLE, ", ".join(str(weight) for weight in WEIGHTS)),
+            [match, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,148 @@
+"""
+批量生成测试数据  出版社、作者、作者详情、图书以及图书与作者的关系
+使用 bulk_create 批量插入  相同的 seed 生成相同的数据
+接口的基准测试(bench_endpoints)、查询次数的测试以及 generate_dataset 命令使用
+
+倾斜分布: 第 n 个出版社/作者被选中的权重为 1 / n ** skew  skew 为 0 时均匀分布
+图书按 chunk_size 分批生成  每批一个事务  内存占用与总数量无关
+"""
+import itertools
+import random
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connections, router, transaction
+
+from api import listing, search
+from api.models import Author, AuthorDetail, Book, DataVersion, Press
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 50000
+
+
+def _bulk_create(model, objs):
+    # 指定的 batch_size 不能超过数据库的限制(sqlite 的参数个数等)
+    connection = connections[router.db_for_write(model)]
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    batch_size = max(min(BATCH_SIZE, connection.ops.bulk_batch_size(fields, objs)), 1)
+    model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def _last_pks(model, count):
+    # bulk_create 在 sqlite 中不回填主键  取最新插入的 count 条
+    pks = model.objects.order_by("-pk").values_list("pk", flat=True)[:count]
+    return list(reversed(list(pks)))
+
+
+def zipf_weights(count, skew):
+    """
+    return: 累计权重  用于 random.choices(cum_weights=...)
+    """
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def make_placeholders(count, storage, seed=0, size=(640, 480)):
+    """
+    生成 count 张不同颜色的占位图片  return: 保存后的文件名
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    names = []
+    for index in range(count):
+        image = Image.new("RGB", size, tuple(rng.randint(0, 255) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        draw.text((size[0] // 2 - 20, size[1] // 2 - 5), "%04d" % index, fill=(255, 255, 255))
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        names.append(storage.save("img/placeholder.jpg", ContentFile(buffer.getvalue())))
+    return names
+
+
+def seed_catalog(books=1000, presses=20, authors=200, authors_per_book=2, seed=0,
+                 press_skew=0.0, author_skew=0.0, deleted=0.0, pics=None,
+                 chunk_size=CHUNK_SIZE, progress=None):
+    """
+    authors_per_book: 每本图书的作者数量为 1 ~ authors_per_book
+    deleted: 逻辑删除的图书所占的比例
+    pics: 图书与出版社随机使用的图片文件名  为空时使用默认图片
+    progress: progress(已生成的图书数量, books)
+    return: {模型名: 生成的数量}
+    没有出版社时不能生成图书(出版社不能为空)  没有作者时图书不关联作者
+    """
+    if min(books, presses, authors) < 0:
+        raise ValueError("生成的数量不能小于 0")
+    if books and not presses:
+        raise ValueError("生成图书至少需要 1 个出版社")
+    rng = random.Random(seed)
+    pic_kwargs = (lambda: {"pic": rng.choice(pics)}) if pics else dict
+
+    with transaction.atomic():
+        _bulk_create(Press, [
+            Press(press_name="出版社%s" % index, address="地址%s" % index, **pic_kwargs())
+            for index in range(presses)
+        ])
+        press_ids = _last_pks(Press, presses)
+
+        _bulk_create(Author, [
+            Author(author_name="作者%s" % index, age=rng.randint(20, 80))
+            for index in range(authors)
+        ])
+        author_ids = _last_pks(Author, authors)
+        _bulk_create(AuthorDetail, [
+            AuthorDetail(author_id=author_id, phone="1%010d" % rng.randint(0, 9999999999))
+            for author_id in author_ids
+        ])
+
+    press_weights = zipf_weights(len(press_ids), press_skew)
+    author_weights = zipf_weights(len(author_ids), author_skew)
+    through = Book.authors.through
+    links = 0
+    for start in range(0, books, chunk_size):
+        count = min(chunk_size, books - start)
+        publish_ids = rng.choices(press_ids, cum_weights=press_weights, k=count)
+        with transaction.atomic():
+            _bulk_create(Book, [
+                Book(book_name="图书%s" % (start + index),
+                     # 价格大致为对数正态分布  集中在几十元
+                     price=Decimal(min(int(rng.lognormvariate(8.2, 0.6)), 99999)) / 100,
+                     publish_id=publish_ids[index],
+                     is_delete=rng.random() < deleted,
+                     **pic_kwargs())
+                for index in range(count)
+            ])
+            book_ids = _last_pks(Book, count)
+
+            chunk_links = []
+            for book_id in book_ids:
+                if not author_ids:
+                    break
+                # 倾斜分布下可能抽到重复的作者  去重
+                picked = rng.choices(author_ids, cum_weights=author_weights, k=rng.randint(1, authors_per_book))
+                for author_id in sorted(set(picked)):
+                    chunk_links.append(through(book_id=book_id, author_id=author_id))
+            _bulk_create(through, chunk_links)
+            links += len(chunk_links)
+            search.index_books(book_ids)
+            listing.sync_books(book_ids)
+        if progress:
+            progress(start + count, books)
+
+    # bulk_create 不触发信号  手动更新数据版本  全文索引与读模型在每批中更新
+    DataVersion.bump(Press, Author, AuthorDetail, Book)
+    return {"press": presses, "author": authors, "author_detail": authors, "book": books,
+            "book_authors": links}
+
+
+def clear_catalog():
+    """
+    清空图书相关的表  直接执行 DELETE  不逐条触发信号
+    """
+    for model in (Book.authors.through, Book, AuthorDetail, Author, Press):
+        connection = connections[router.db_for_write(model)]
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % connection.ops.quote_name(model._meta.db_table))
+    search.rebuild()
+    listing.rebuild()
+    DataVersion.bump(Press, Author, AuthorDetail, Book)
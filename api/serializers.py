@@ -1,21 +1,30 @@
+from django.db import connections, router, transaction
+from django.db.models import Max, Q
 from rest_framework import serializers, exceptions
 
-from api.models import Book, Press
+from api import listing, search
+from api.models import Book, BookListing, Press, DataVersion
+from utils.renditions import RenditionField
+from utils.dynamic_fields import DynamicFieldsMixin
+from utils.relations import BatchedPrimaryKeyRelatedField, preload_related
+from utils.timing import TimedSerializerMixin
 
 
-class PressModelSerializer(serializers.ModelSerializer):
+class PressModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     出版社的序列化器
     """
+    # 图片各个尺寸的地址
+    pic_renditions = RenditionField(source="pic")
 
     class Meta:
         # 指定序列化的模型
         model = Press
         # 指定要序列化的字段
-        fields = ("press_name", "address", "pic")
+        fields = ("press_name", "address", "pic", "pic_renditions")
 
 
-class BookModelSerializer(serializers.ModelSerializer):
+class BookModelSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     # 为序列化器自定以字段 (不推荐)
     # aaa = serializers.SerializerMethodField()
     #
@@ -26,13 +35,18 @@ class BookModelSerializer(serializers.ModelSerializer):
     # 可以在序列化器中嵌套另一个序列化器来完成多表查询
     # 需要与图书表的中外键名保持一致  在连表查询较多字段时推荐使用
     publish = PressModelSerializer()
+    pic_renditions = RenditionField(source="pic")
 
     class Meta:
         # 指定当前序列化器要序列化的模型
         model = Book
         # 指定你要序列化模型的字段
         # fields = ("book_name", "price", "pic", "publish_name", "press_address", "author_list", "publish")
-        fields = ("book_name", "price", "pic", "publish")
+        fields = ("book_name", "price", "pic", "pic_renditions", "publish")
+        # ?expand=authors 时输出作者列表  ?fields= 可以去掉 publish 等字段
+        expandable_fields = {
+            "authors": serializers.ReadOnlyField(source="author_list"),
+        }
 
         # 可以直接查询所有字段
         # fields = "__all__"
@@ -43,15 +57,174 @@ class BookModelSerializer(serializers.ModelSerializer):
         # 指定查询深度  关联对象的查询  可以查询出有外键关系的信息
         # depth = 1
 
+class NonSequentialPks(Exception):
+    """群增时无法确定新数据的主键"""
+
+
+# 序列化器定义了要使用
+class BookListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    # 群增时每条 INSERT 语句插入的最大条数
+    batch_size = 500
+
+    def to_internal_value(self, data):
+        # 所有数据的关联主键一次性查询  子序列化器校验时不再逐个查询
+        with preload_related(self.child, data):
+            return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        """
+        群增：一条(分批的) INSERT 插入所有图书  再一次性插入多对多的关系表
+        所有语句在同一个事务中完成
+        """
+        model = self.child.Meta.model
+        db = router.db_for_write(model)
+        connection = connections[db]
+        # 既不能回填主键也不是sqlite的数据库无法得知新数据的主键  使用逐条新增
+        returns_ids = getattr(connection.features, "can_return_rows_from_bulk_insert",
+                              getattr(connection.features, "can_return_ids_from_bulk_insert", False))
+        if not returns_ids and connection.vendor != "sqlite":
+            return super().create(validated_data)
+
+        # 只处理自动生成的关系表  自定义 through 的关系表有额外的字段
+        m2m_fields = [field for field in model._meta.many_to_many
+                      if field.remote_field.through._meta.auto_created]
+        objs = []
+        relations = []
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            relations.append({field.name: attrs.pop(field.name) for field in m2m_fields if field.name in attrs})
+            objs.append(model(**attrs))
+
+        try:
+            return self._bulk_create(model, db, objs, relations, m2m_fields, returns_ids)
+        except NonSequentialPks:
+            # 已经回滚  逐条新增  由信号更新版本与索引
+            return super().create(validated_data)
+
+    def _bulk_create(self, model, db, objs, relations, m2m_fields, returns_ids):
+        with transaction.atomic(using=db):
+            last_pk = None
+            if not returns_ids:
+                last_pk = model.objects.using(db).aggregate(last=Max("pk"))["last"] or 0
+            objs = model.objects.using(db).bulk_create(objs, batch_size=self.batch_size)
+            if objs and objs[0].pk is None:
+                self._fill_pks(model, db, objs, last_pk)
+
+            for field in m2m_fields:
+                through = field.remote_field.through
+                source = "%s_id" % field.m2m_field_name()
+                target = "%s_id" % field.m2m_reverse_field_name()
+                rows = []
+                for obj, relation in zip(objs, relations):
+                    # 去重  与 .set() 的行为保持一致
+                    target_ids = {related.pk for related in relation.get(field.name, ())}
+                    rows.extend(through(**{source: obj.pk, target: pk}) for pk in target_ids)
+                through.objects.using(db).bulk_create(rows, batch_size=self.batch_size)
+
+            # 批量操作不会触发信号  手动更新版本与全文索引
+            DataVersion.bump(model)
+            if model is Book:
+                search.index_books(obj.pk for obj in objs)
+                listing.sync_books(obj.pk for obj in objs)
+
+        return objs
+
+    def _fill_pks(self, model, db, objs, last_pk):
+        """
+        sqlite 的 bulk_create 不会回填主键
+        插入之前记录表中最大的主键  插入之后查询出比它大的主键  按插入顺序回填
+        只有数量与插入的数据相同时才能确定是这次插入的数据
+        读取最大主键与第一条 INSERT 之间其他连接插入了数据时  抛出 NonSequentialPks 回滚
+        """
+        pks = list(model.objects.using(db).filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True))
+        if len(pks) != len(objs):
+            raise NonSequentialPks()
+        for obj, pk in zip(objs, pks):
+            obj.pk = pk
+
+    # 使用此序列化器完成或修改多个对象
+    def update(self, instance, validated_data):
+        """
+        群改：一条(分批的) bulk_update 更新所有对象修改过的字段
+        对象由视图一次查询出完整的数据  没有修改的字段写回原值
+        多对多关系一条 DELETE 删除不再需要的关系  一条 INSERT 补充缺少的关系
+        """
+        # print(self)  #当前序列化器类
+        # print(instance) #要修改的原对象
+        # print(validated_data) #新的数据
+        model = self.child.Meta.model
+        db = router.db_for_write(model)
+        m2m_names = {field.name for field in model._meta.many_to_many
+                     if field.remote_field.through._meta.auto_created}
+
+        # 所有对象修改过的字段  以及修改了字段的对象
+        fields = set()
+        objs = []
+        # 多对多字段名 -> {对象主键: 新的关联主键集合}
+        m2m_changes = {name: {} for name in m2m_names}
+        for obj, attrs in zip(instance, validated_data):
+            changed_fields = []
+            for attr, value in attrs.items():
+                if attr in m2m_names:
+                    m2m_changes[attr][obj.pk] = {related.pk for related in value}
+                else:
+                    setattr(obj, attr, value)
+                    changed_fields.append(attr)
+            if changed_fields:
+                fields.update(changed_fields)
+                objs.append(obj)
+
+        with transaction.atomic(using=db):
+            if objs:
+                model.objects.using(db).bulk_update(objs, sorted(fields), batch_size=self.batch_size)
+            for name, changes in m2m_changes.items():
+                if changes:
+                    self._update_m2m(model._meta.get_field(name), db, changes)
+            DataVersion.bump(model)
+            if model is Book:
+                changed = {obj.pk for obj in objs}
+                for changes in m2m_changes.values():
+                    changed.update(changes)
+                search.index_books(changed)
+                listing.sync_books(changed)
+
+        return instance
+
+    def _update_m2m(self, field, db, changes):
+        """
+        不查询现有的关系  一条 DELETE 删除新集合以外的关系  一条 INSERT 写入新集合
+        关系表有 (source, target) 的唯一约束  已经存在的关系被忽略
+        """
+        through = field.remote_field.through
+        source = "%s_id" % field.m2m_field_name()
+        target = "%s_id" % field.m2m_reverse_field_name()
+
+        removed = Q()
+        added = []
+        for source_id, target_ids in changes.items():
+            condition = Q(**{source: source_id})
+            if target_ids:
+                condition &= ~Q(**{target + "__in": list(target_ids)})
+            removed |= condition
+            added.extend(through(**{source: source_id, target: pk}) for pk in target_ids)
 
-class BookDeModelSerializer(serializers.ModelSerializer):
+        # 关系表注册了 m2m_changed 信号  QuerySet.delete() 会先查询出要删除的行
+        # 批量操作本来就不发送信号  直接删除
+        through.objects.using(db).filter(removed)._raw_delete(db)
+        through.objects.using(db).bulk_create(added, batch_size=self.batch_size, ignore_conflicts=True)
+
+
+class BookDeModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     反序列器  数据入库使用
     """
+    # 关联字段使用支持批量校验的主键字段
+    serializer_related_field = BatchedPrimaryKeyRelatedField
 
     class Meta:
         model = Book
         fields = ("book_name", "price", "publish", "authors")
+        list_serializer_class = BookListSerializer
 
         # 添加DRF所提供的校验规则
         extra_kwargs = {
@@ -75,27 +248,22 @@ class BookDeModelSerializer(serializers.ModelSerializer):
             raise exceptions.ValidationError("图书名含有敏感字")
         return value
 
-# 序列化器定义了要使用
-class BookListSerializer(serializers.ListSerializer):
-    # 使用此序列化器完成或修改多个对象
-    def update(self, instance, validated_data):
-        # print(self)  #当前序列化器类
-        # print(instance) #要修改的原对象
-        # print(validated_data) #新的数据
-        # 通过循环一个一个的进行修改
-        for index, obj in enumerate(instance):
-            # 每遍历一次 就修改一个对象的数据
-            self.child.update(obj, validated_data[index])
-
-        return instance
+class BookModelSerializerV2(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    # 关联字段使用支持批量校验的主键字段
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+    pic_renditions = RenditionField(source="pic")
 
-class BookModelSerializerV2(serializers.ModelSerializer):
     class Meta:
         model = Book
         # fields应该填写哪些字段  应该填写序列化与反序列化字段的并集
-        fields = ("book_name", "price", "publish", "authors", "pic")
+        fields = ("book_name", "price", "publish", "authors", "pic", "pic_renditions")
         # 为修改多个图书对象提供ListSerializer
         list_serializer_class=BookListSerializer
+        # ?expand=publish,authors 时输出出版社与作者的信息
+        expandable_fields = {
+            "publish": PressModelSerializer(read_only=True),
+            "authors": serializers.ReadOnlyField(source="author_list"),
+        }
 
         # 通过此参数指定哪些字段是参与序列化的  哪些字段是参与反序列化的
         extra_kwargs = {
@@ -124,7 +292,6 @@ class BookModelSerializerV2(serializers.ModelSerializer):
         # 自定义用户名校验规则
         if "1" in value:
             raise exceptions.ValidationError("图书名含有敏感字")
-        print(self.context.get("request"))
         return value
 
     # 全局校验钩子  可以通过attrs获取到前台发送的所有的参数
@@ -135,4 +302,33 @@ class BookModelSerializerV2(serializers.ModelSerializer):
         if price > 100:
             raise exceptions.ValidationError("书籍价格过高")
 
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class ListingPressSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    读模型中展开保存的出版社  输出与 PressModelSerializer 相同
+    """
+    address = serializers.CharField(source="press_address", read_only=True)
+    pic = serializers.ImageField(source="press_pic", read_only=True)
+    pic_renditions = RenditionField(source="press_pic")
+
+    class Meta:
+        model = BookListing
+        fields = ("press_name", "address", "pic", "pic_renditions")
+
+
+class BookListingSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    从读模型 bz_book_listing 输出图书列表  只读  输出与 BookModelSerializerV2 相同
+    出版社与作者都在同一行中  展开时不需要连表与预加载
+    """
+    pic_renditions = RenditionField(source="pic")
+
+    class Meta:
+        model = BookListing
+        fields = ("book_name", "price", "pic", "pic_renditions")
+        expandable_fields = {
+            "publish": ListingPressSerializer(source="*", read_only=True),
+            "authors": serializers.ReadOnlyField(source="author_list"),
+        }
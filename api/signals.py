@@ -0,0 +1,123 @@
+# 数据发生变化时增加对应表的版本号  批量操作不会触发信号  需要在批量操作中手动调用 DataVersion.bump
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from api import listing, search
+from api.models import Book, Press, Author, AuthorDetail, DataVersion
+from utils.renditions import schedule_renditions
+from utils.storage import release
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Press)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=AuthorDetail)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Press)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=AuthorDetail)
+def bump_version(sender, **kwargs):
+    DataVersion.bump(sender)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def bump_book_authors_version(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        DataVersion.bump(Book)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Press)
+def generate_pic_renditions(sender, instance, **kwargs):
+    # 事务提交后再生成  避免后台线程读取到未提交的数据
+    transaction.on_commit(lambda: schedule_renditions(instance.pic))
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=Press)
+def remember_old_pic(sender, instance, **kwargs):
+    # 上传了新的图片  记录下原来的图片  保存后检查原图片是否还有引用
+    if instance.pk and instance.pic and not instance.pic._committed:
+        instance._old_pic = sender.objects.filter(pk=instance.pk).values_list("pic", flat=True).first()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Press)
+def release_old_pic(sender, instance, **kwargs):
+    old = getattr(instance, "_old_pic", None)
+    if old and old != instance.pic.name:
+        transaction.on_commit(lambda: release(old, Book, Press))
+    instance._old_pic = None
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Press)
+def release_deleted_pic(sender, instance, **kwargs):
+    name = instance.pic.name
+    transaction.on_commit(lambda: release(name, Book, Press))
+
+
+# 全文索引与图书列表的读模型  与数据在同一个事务中更新
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+    listing.sync_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_index(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+    listing.remove_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def index_book_authors(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # 清空作者的所有图书时 pk_set 为空  提前记录作者的图书
+        instance._search_book_ids = list(instance.books.values_list("pk", flat=True))
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        book_ids = [instance.pk]
+    elif action == "post_clear":
+        book_ids = getattr(instance, "_search_book_ids", ())
+    else:
+        book_ids = list(pk_set)
+    search.index_books(book_ids)
+    listing.sync_books(book_ids)
+
+
+@receiver(post_save, sender=Press)
+def index_press(sender, instance, created, **kwargs):
+    if not created:
+        search.update_press(instance)
+        listing.update_press(instance)
+
+
+@receiver(post_save, sender=Author)
+def index_author(sender, instance, created, **kwargs):
+    if not created:
+        book_ids = list(instance.books.values_list("pk", flat=True))
+        search.index_books(book_ids)
+        listing.sync_books(book_ids)
+
+
+@receiver(pre_delete, sender=Author)
+def remember_deleted_author_books(sender, instance, **kwargs):
+    # 删除后关系表中的数据也被删除  提前记录作者的图书
+    instance._search_book_ids = list(instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def index_deleted_author_books(sender, instance, **kwargs):
+    book_ids = getattr(instance, "_search_book_ids", ())
+    search.index_books(book_ids)
+    listing.sync_books(book_ids)
+
+
+@receiver(post_save, sender=AuthorDetail)
+@receiver(post_delete, sender=AuthorDetail)
+def sync_author_detail(sender, instance, **kwargs):
+    # 作者的电话保存在读模型中
+    listing.sync_author(instance.author_id)
@@ -1,3 +1,1045 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import importlib
+import json
+import logging
+import os
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
+from urllib.parse import parse_qs, urlparse
+
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.migrations.loader import MigrationLoader
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
 
 # Create your tests here.
+from api import listing, search
+from api.models import Book, BookListing, DataVersion, Press, Author
+from api.seeding import seed_catalog
+from api.views import BookExportAPIView
+from api.serializers import (BookDeModelSerializer, BookListSerializer, BookModelSerializer, BookModelSerializerV2,
+                             NonSequentialPks)
+from day4.serializers import BookModelSerializer as Day4BookModelSerializer
+from utils.cache import get_response_cache
+from utils.compression import CompressionMiddleware
+from utils.db import apply_sqlite_pragmas
+from utils.logs import AsyncHandler, DedupeFilter
+from utils import renditions
+from utils.media import _cache_control, serve_media
+from utils.pagination import BookCursorPagination
+from utils.prefetch import get_eager_loading_plan, setup_eager_loading
+from utils.renderers import msgpack
+from utils.routers import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from utils.storage import HashedFileSystemStorage, default_names, media_storage, release
+from utils.testing import QueryCountMixin
+from utils.timing import TimingMiddleware, metrics
+from utils import values_serializer
+from utils.values_serializer import ValuesSerializer
+
+
+class ValuesSerializerTest(TestCase):
+    """
+    快速序列化的输出必须与原序列化器完全一致
+    """
+
+    def setUp(self):
+        press = Press.objects.create(press_name="人民出版社", address="北京", pic="img/dt.jpg")
+        other = Press.objects.create(press_name="清华出版社", address="北京", pic="")
+        author = Author.objects.create(author_name="张三", age=30)
+        for index, publish in enumerate([press, other, press]):
+            book = Book.objects.create(book_name="图书%s" % index, price="%s.50" % index, publish=publish)
+            book.authors.add(author)
+        Book.objects.create(book_name="无图图书", price="9.99", publish=press, pic="")
+
+    def assertParity(self, serializer_class, context=None):
+        queryset = Book.objects.all()
+        request = (context or {}).get("request")
+        expected = serializer_class(queryset, many=True, context=context or {}).data
+        self.assertEqual(ValuesSerializer(serializer_class).serialize(queryset, request=request), expected)
+
+    def test_nested_serializer(self):
+        self.assertParity(BookModelSerializer)
+
+    def test_flat_serializer(self):
+        self.assertParity(BookModelSerializerV2)
+        self.assertParity(Day4BookModelSerializer)
+
+    def test_absolute_url(self):
+        request = Request(RequestFactory().get("/api/books/"))
+        self.assertParity(BookModelSerializer, {"request": request})
+
+
+class QueryCountTest(QueryCountMixin, TestCase):
+    """
+    接口的查询次数不能随数据量增加
+    """
+    urls = ["/api/books/", "/api/v2/books/", "/api/v2/books/?page_size=20", "/api/v2/books/export/",
+            "/api/books/?expand=authors", "/api/v2/books/?expand=publish,authors&page_size=20"]
+
+    def test_constant_queries(self):
+        seed_catalog(books=3, presses=2, authors=3)
+        before = {url: self.count_queries(url) for url in self.urls}
+        seed_catalog(books=30, presses=5, authors=10, seed=1)
+        after = {url: self.count_queries(url) for url in self.urls}
+        self.assertEqual(before, after)
+
+
+class SoftDeleteTest(TestCase):
+    """
+    objects 包含逻辑删除的数据  alive 只查询未删除的数据
+    """
+
+    def setUp(self):
+        seed_catalog(books=6, presses=1, authors=2)
+        self.book = Book.objects.order_by("pk").first()
+
+    def test_managers(self):
+        self.assertEqual(Book.objects.filter(pk=self.book.pk).soft_delete(), 1)
+        self.assertEqual((Book.objects.count(), Book.alive.count(), Book.objects.alive().count()), (6, 5, 5))
+        self.assertTrue(Book.objects.get(pk=self.book.pk).is_delete)
+        with self.assertRaises(Book.DoesNotExist):
+            Book.alive.get(pk=self.book.pk)
+        # alive 上同样可以使用查询集的方法
+        self.assertEqual(Book.alive.all().soft_delete(), 5)
+        self.assertFalse(Book.alive.exists())
+        # 关联查询使用默认的管理器  仍然可以看到删除的图书
+        self.assertEqual(Press.objects.get().books.count(), 6)
+
+    def test_indexes(self):
+        # 0003 添加以 is_delete 开头的索引(0006 替换了出版社的索引)
+        state = MigrationLoader(connection).project_state(("api", "0003_book_soft_delete_indexes"))
+        names = [index.name for index in state.models["api", "book"].options["indexes"]]
+        self.assertEqual(names, ["bz_book_delete_time_idx", "bz_book_delete_publish_idx"])
+        constraints = connection.introspection.get_constraints(connection.cursor(), Book._meta.db_table)
+        self.assertEqual(constraints["bz_book_delete_time_idx"]["columns"], ["is_delete", "create_time", "id"])
+        # 未删除的图书按创建时间排序时直接使用索引的顺序
+        queryset = Book.alive.order_by("-create_time", "-id")
+        with connection.cursor() as cursor:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("bz_book_delete_time_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_migrations_complete(self):
+        # 模型与迁移文件一致
+        call_command("makemigrations", "api", check=True, dry_run=True, stdout=StringIO())
+
+
+class SeedingTest(TestCase):
+
+    def test_seed(self):
+        counts = seed_catalog(books=20, presses=3, authors=4, authors_per_book=3, seed=2)
+        self.assertEqual((Book.objects.count(), Press.objects.count(), Author.objects.count()), (20, 3, 4))
+        self.assertEqual(Book.authors.through.objects.count(), counts["book_authors"])
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def test_no_authors(self):
+        # 没有作者时图书不关联作者
+        counts = seed_catalog(books=5, presses=1, authors=0)
+        self.assertEqual((Book.objects.count(), counts["book_authors"]), (5, 0))
+
+    def test_no_presses(self):
+        with self.assertRaises(ValueError):
+            seed_catalog(books=5, presses=0, authors=2)
+        self.assertFalse(Book.objects.exists())
+        self.assertEqual(seed_catalog(books=0, presses=0, authors=0)["book"], 0)
+        with self.assertRaises(CommandError):
+            call_command("generate_dataset", books=5, presses=0, stdout=StringIO(), stderr=StringIO())
+
+
+class CursorPaginationTest(TestCase):
+    """
+    按游标逐页读取  排序值相同的数据既不重复也不遗漏
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(books=23, presses=2, authors=3, seed=3)
+        books = list(Book.objects.order_by("pk"))
+        # 只有 3 种价格  创建时间全部相同
+        for index, book in enumerate(books):
+            Book.objects.filter(pk=book.pk).update(price=(10, 20, 30)[index % 3], create_time=books[0].create_time)
+
+    def setUp(self):
+        get_response_cache().invalidate()
+
+    def walk(self, url):
+        names, pages = [], 0
+        while url:
+            get_response_cache().invalidate()
+            data = self.client.get(url).json()
+            names += [book["book_name"] for book in data["results"]]
+            url, pages = data["next"], pages + 1
+        return names, pages
+
+    def expected(self, *ordering):
+        return list(Book.alive.order_by(*ordering).values_list("book_name", flat=True))
+
+    def test_duplicate_keys(self):
+        names, pages = self.walk("/api/v2/books/?page_size=4")
+        self.assertEqual(names, self.expected("-create_time", "-id"))
+        self.assertEqual(pages, 6)
+        names, _ = self.walk("/api/v2/books/?ordering=price&page_size=5")
+        self.assertEqual(names, self.expected("price", "id"))
+
+    def test_descending(self):
+        # 倒序时比较条件反向(lt)
+        names, _ = self.walk("/api/v2/books/?ordering=-price&page_size=5")
+        self.assertEqual(names, self.expected("-price", "-id"))
+        self.assertEqual(len(set(names)), Book.alive.count())
+
+    def test_tampered_cursor(self):
+        cursor = parse_qs(urlparse(self.client.get("/api/v2/books/?page_size=4").json()["next"]).query)["cursor"][0]
+        position = json.loads(base64.urlsafe_b64decode(cursor))
+        tampered = [
+            "abc", "!!!",
+            base64.urlsafe_b64encode(b"not json").decode(),
+            base64.urlsafe_b64encode(json.dumps(position[:1]).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps(["yesterday", position[1]]).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps([position[0], "x"]).encode()).decode(),
+        ]
+        for value in tampered:
+            with self.assertLogs("utils.exceptions", "INFO"), self.assertLogs("django.request", "WARNING"):
+                response = self.client.get("/api/v2/books/", {"page_size": 4, "cursor": value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertEqual(response.json(), {"status": 400, "message": "无效的分页游标"})
+
+    def test_seek_plan(self):
+        # 游标条件包含第一个排序字段的范围  按索引查找到游标的位置  不从索引的开头扫描
+        book = Book.alive.order_by("-create_time", "-id")[10]
+        for ordering, bound in ((("-create_time", "-id"), "create_time<"), (("price", "id"), "price>")):
+            paginator = BookCursorPagination()
+            paginator.fields = [name.lstrip("-") for name in ordering]
+            paginator.descending = ordering[0].startswith("-")
+            position = [getattr(book, name) for name in paginator.fields]
+            queryset = Book.alive.order_by(*ordering).filter(paginator.get_position_filter(position))
+            plan = queryset[:5].explain()
+            self.assertIn(bound, plan.replace(" ", ""), plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+
+class PrefetchTest(TestCase):
+    """
+    按序列化器的字段树预加载关联  序列化时不再逐行查询
+    """
+
+    def setUp(self):
+        seed_catalog(books=20, presses=3, authors=5)
+
+    def serializer(self, query):
+        request = Request(RequestFactory().get("/", query))
+        return BookModelSerializerV2(context={"request": request, "query_params": request.query_params})
+
+    def test_plan(self):
+        self.assertEqual(get_eager_loading_plan(BookModelSerializer), (["publish"], []))
+        self.assertEqual(get_eager_loading_plan(self.serializer({"expand": "publish,authors"})),
+                         (["publish"], ["authors__detail"]))
+        self.assertEqual(get_eager_loading_plan(self.serializer({"fields": "book_name,price"})), ([], []))
+
+    def test_query_count(self):
+        # 没有预加载时每本图书查询一次出版社
+        with self.assertNumQueries(21):
+            BookModelSerializer(Book.alive.all(), many=True).data
+        with self.assertNumQueries(1):
+            BookModelSerializer(setup_eager_loading(Book.alive.all(), BookModelSerializer), many=True).data
+        # 图书、作者、作者详情  与图书的数量无关
+        serializer = self.serializer({"expand": "publish,authors"})
+        with self.assertNumQueries(3):
+            data = type(serializer)(setup_eager_loading(Book.alive.all(), serializer), many=True,
+                                    context=serializer.context).data
+        self.assertEqual(len(data), 20)
+        self.assertIn("detail__phone", data[0]["authors"][0])
+
+    def test_author_list(self):
+        # Book.author_list 使用预加载的作者与详情
+        books = list(Book.alive.prefetch_related("authors__detail"))
+        with self.assertNumQueries(0):
+            lists = [book.author_list for book in books]
+        self.assertEqual(lists[0], list(Book.objects.get(pk=books[0].pk).author_list))
+
+
+class DynamicFieldsTest(QueryCountMixin, TestCase):
+    """
+    ?fields= / ?expand= 只输出并且只查询需要的字段
+    """
+
+    def setUp(self):
+        seed_catalog(books=5, presses=2, authors=3)
+        get_response_cache().invalidate()
+
+    def get(self, url):
+        response, queries = self.get_with_queries(url)
+        return response.json()["results"], queries
+
+    def test_fields(self):
+        rows, queries = self.get("/api/books/?fields=book_name,price")
+        self.assertEqual(set(rows[0]), {"book_name", "price"})
+        # 没有输出出版社  不连表
+        self.assertFalse(any("JOIN" in sql for sql in queries))
+
+    def test_expand(self):
+        rows, _ = self.get("/api/v2/books/?expand=publish,authors&fields=book_name,publish,authors")
+        self.assertEqual(list(rows[0]), ["book_name", "publish", "authors"])
+        self.assertIn("press_name", rows[0]["publish"])
+        self.assertIn("author_name", rows[0]["authors"][0])
+
+    def test_unknown_names(self):
+        # 不存在的字段名被忽略  不会为每种组合增加编译结果
+        self.get("/api/books/?fields=book_name,price")
+        size = len(values_serializer._compiled)
+        for index in range(5):
+            rows, _ = self.get("/api/books/?fields=book_name,price,x%s&expand=y%s" % (index, index))
+            self.assertEqual(set(rows[0]), {"book_name", "price"})
+        self.assertEqual(len(values_serializer._compiled), size)
+
+    def test_export_ignores_expand(self):
+        # 导出使用 iterator()  不能预加载作者  忽略 ?expand=
+        response, queries = self.get_with_queries("/api/v2/books/export/?expand=authors")
+        self.assertNotIn("authors", json.loads(response.streamed.decode().splitlines()[0]))
+        self.assertLess(len(queries), 5)
+
+
+class ExportTest(QueryCountMixin, TestCase):
+    """
+    流式导出  分块读取  查询次数与图书数量无关
+    """
+
+    def setUp(self):
+        seed_catalog(books=12, presses=2, authors=3, deleted=0.2, seed=4)
+        self.names = list(Book.alive.order_by("id").values_list("book_name", flat=True))
+
+    def test_jsonl(self):
+        with mock.patch.object(BookExportAPIView, "chunk_size", 5):
+            response, queries = self.get_with_queries("/api/v2/books/export/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in response.streamed.decode().splitlines()]
+        # 只导出未删除的图书  按主键排序
+        self.assertLess(len(rows), 12)
+        self.assertEqual([row["book_name"] for row in rows], self.names)
+        # 一次查询  分块读取游标
+        self.assertEqual(len(queries), 1, "\n".join(queries))
+        # 与列表接口的字段相同
+        self.assertEqual(list(rows[0]), list(self.client.get("/api/v2/books/").json()["results"][0]))
+
+    def test_csv(self):
+        response, queries = self.get_with_queries("/api/v2/books/export/?type=csv&fields=book_name,price")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="books.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(response.streamed.decode())))
+        self.assertEqual(list(rows[0]), ["book_name", "price"])
+        self.assertEqual([row["book_name"] for row in rows], self.names)
+        self.assertEqual(len(queries), 1)
+
+    def test_unknown_type(self):
+        response = self.client.get("/api/v2/books/export/?type=xml")
+        self.assertEqual(response.json()["status"], 400)
+
+
+class BulkWriteTest(QueryCountMixin, TestCase):
+    """
+    群增回填的主键正确  群改的查询次数不超过 QUERY_BUDGETS  多对多只写入差异
+    """
+
+    def setUp(self):
+        seed_catalog(books=10, presses=2, authors=4)
+        self.book_ids = list(Book.alive.order_by("pk").values_list("pk", flat=True))
+        self.author_ids = list(Author.objects.order_by("pk").values_list("pk", flat=True))
+        self.budget = settings.QUERY_BUDGETS["*"]
+
+    def write(self, method, url, data):
+        with self.record_queries() as queries:
+            response = getattr(self.client, method)(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), self.budget, "\n".join(queries))
+        return response.json()
+
+    def authors(self, book_id):
+        return set(Book.objects.get(pk=book_id).authors.values_list("pk", flat=True))
+
+    def test_patch(self):
+        first, second, third = self.book_ids[:3]
+        kept = self.authors(second)
+        data = self.write("patch", "/api/v2/books/", [
+            {"pk": first, "price": "8.00", "authors": self.author_ids[:2]},
+            {"pk": second, "book_name": "新的书名"},
+            {"pk": third, "authors": self.author_ids[3:]},
+            {"pk": 99999, "price": "3.00"},
+        ])
+        self.assertEqual(data["missing"], [99999])
+        self.assertEqual(str(Book.objects.get(pk=first).price), "8.00")
+        self.assertEqual(Book.objects.get(pk=second).book_name, "新的书名")
+        self.assertEqual(self.authors(first), set(self.author_ids[:2]))
+        self.assertEqual(self.authors(second), kept)
+        self.assertEqual(self.authors(third), set(self.author_ids[3:]))
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def test_patch_many(self):
+        # 查询次数与修改的图书数量无关
+        self.write("patch", "/api/v2/books/", [
+            {"pk": pk, "price": "9.00", "authors": self.author_ids[index % 4:]}
+            for index, pk in enumerate(self.book_ids)
+        ])
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def post_many(self):
+        press = Press.objects.first()
+        data = [{"book_name": "群增图书%s" % "ABCDE"[index], "price": "6.00", "publish": press.pk,
+                 "authors": self.author_ids[index % 4:index % 4 + 2]} for index in range(5)]
+        serializer = BookDeModelSerializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+        return data, serializer.save()
+
+    def assert_created(self, data, books):
+        # 回填的主键与关系表都指向对应的图书
+        self.assertEqual(len(books), len(data))
+        for item, book in zip(data, books):
+            self.assertEqual(Book.objects.get(pk=book.pk).book_name, item["book_name"])
+            self.assertEqual(self.authors(book.pk), set(item["authors"]))
+        self.assertEqual(Book.objects.filter(book_name__startswith="群增图书").count(), len(data))
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def test_post_many(self):
+        # 最大的主键不是最新的数据时  按插入前的最大主键回填
+        Book.objects.filter(pk=self.book_ids[-1]).delete()
+        self.assert_created(*self.post_many())
+
+    def test_post_many_fallback(self):
+        # 无法确定主键时回滚  逐条新增
+        with mock.patch.object(BookListSerializer, "_fill_pks", side_effect=NonSequentialPks):
+            self.assert_created(*self.post_many())
+
+    def test_patch_full(self):
+        # 没有群体整体修改(PUT)的接口  群改传递所有的字段时等同于整体修改
+        press = Press.objects.first()
+        self.write("patch", "/api/v2/books/", [
+            {"pk": pk, "book_name": "整体修改%s" % "ABCDEFGHIJ"[index], "price": "7.00", "publish": press.pk,
+             "authors": self.author_ids[1:3]}
+            for index, pk in enumerate(self.book_ids)
+        ])
+        self.assertEqual(self.authors(self.book_ids[-1]), set(self.author_ids[1:3]))
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def test_validate_many(self):
+        # 群增校验关联的主键  每个模型只查询一次  与数据的数量无关
+        presses = list(Press.objects.values_list("pk", flat=True))
+        for count in (2, 20):
+            data = [{"book_name": "校验" + chr(ord("A") + index), "price": "6.00", "publish": presses[index % 2],
+                     "authors": self.author_ids[index % 4:]} for index in range(count)]
+            serializer = BookDeModelSerializer(data=data, many=True)
+            with self.record_queries() as queries:
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+            tables = sorted(sql.split(" FROM ")[1].split()[0].strip('"') for sql in queries)
+            self.assertEqual(tables, ["bz_author", "bz_press"], "\n".join(queries))
+        # 不存在的主键与逐条查询时的错误相同
+        data[0]["publish"], data[1]["authors"] = 99999, [99999]
+        serializer = BookDeModelSerializer(data=data, many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors[0]["publish"][0].code, "does_not_exist")
+        self.assertEqual(serializer.errors[1]["authors"][0].code, "does_not_exist")
+
+
+class ResponseCacheTest(TestCase):
+    """
+    命中/未命中的统计  只有实际写入了数据才清空缓存
+    """
+
+    def setUp(self):
+        seed_catalog(books=5, presses=2, authors=3)
+        self.cache = get_response_cache()
+        self.cache.invalidate()
+
+    def test_hit_and_miss(self):
+        before = self.cache.stats()
+        self.assertEqual(self.client.get("/api/v2/books/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/v2/books/")["X-Cache"], "HIT")
+        after = self.cache.stats()
+        self.assertEqual((after["hits"] - before["hits"], after["misses"] - before["misses"]), (1, 1))
+
+    def test_invalidate_on_write(self):
+        self.client.get("/api/v2/books/")
+        # 删除不存在的图书  状态码是 200  错误在响应的内容中  没有写入数据
+        response = self.client.delete("/api/v2/books/", {"ids": [99999]}, content_type="application/json")
+        self.assertEqual((response.status_code, response.json()["status"]), (200, 400))
+        self.assertEqual(len(self.cache.backend), 1)
+        self.client.delete("/api/v2/books/", {"ids": [Book.alive.first().pk]}, content_type="application/json")
+        self.assertEqual(len(self.cache.backend), 0)
+
+    def test_counters_thread_safe(self):
+        request = RequestFactory().get("/api/v2/books/")
+        before = self.cache.stats()
+
+        def worker():
+            for _ in range(500):
+                self.cache.get(request)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        after = self.cache.stats()
+        self.assertEqual(after["hits"] + after["misses"] - before["hits"] - before["misses"], 4000)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTest(TestCase):
+    """
+    安全的请求读取从库  写入了数据的请求设置固定读取主库的 cookie
+    """
+
+    def request(self, method, write=False, status=200, **cookies):
+        seen = []
+
+        def view(request):
+            seen.append(ReplicaRouter().db_for_read(Book))
+            if write:
+                DataVersion.bump(Book)
+            return HttpResponse(status=status)
+
+        request = getattr(RequestFactory(), method)("/api/v2/books/")
+        request.COOKIES.update(cookies)
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], PIN_COOKIE in response.cookies
+
+    def test_routing(self):
+        self.assertEqual(self.request("get"), ("replica", False))
+        self.assertEqual(self.request("get", **{PIN_COOKIE: "1"}), ("default", False))
+        self.assertEqual(self.request("post"), ("default", False))
+        self.assertEqual(ReplicaRouter().db_for_write(Book), "default")
+
+    def test_pin_cookie(self):
+        self.assertEqual(self.request("post", write=True), ("default", True))
+        # 返回 200 但没有写入数据  不固定
+        self.assertEqual(self.request("delete"), ("default", False))
+        self.assertEqual(self.request("patch", write=True, status=201), ("default", True))
+
+
+class AsyncViewTest(TestCase):
+    """
+    Django 2.x 不能通过 ASGI 部署  不注册异步的接口
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(books=5, presses=2, authors=3, seed=0)
+
+    @skipIf(django.VERSION >= (3, 0), "Django 3.0 以上支持 ASGI")
+    def test_asgi_unsupported(self):
+        self.assertFalse(hasattr(settings, "ASGI_APPLICATION"))
+        with self.assertRaises(ImproperlyConfigured):
+            importlib.import_module("drf_day3.asgi")
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get("/api/async/books/").status_code, 404)
+
+    @skipIf(django.VERSION < (3, 1), "异步视图需要 Django 3.1 以上")
+    def test_same_as_sync(self):
+        book = Book.alive.first()
+        for path in ("books/", "books/%s/" % book.pk, "v2/books/"):
+            response = self.client.get("/api/async/" + path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/json")
+            get_response_cache().invalidate()
+            self.assertEqual(response.json(), self.client.get("/api/" + path).json(), path)
+        detail = self.client.get("/api/async/v2/books/%s/" % book.pk).json()
+        self.assertIn(detail["results"], self.client.get("/api/async/v2/books/").json()["results"])
+        self.assertEqual(self.client.get("/api/async/books/0/").json(), {"status": 400, "message": "图书不存在"})
+
+    @skipIf(django.VERSION < (3, 1), "异步视图需要 Django 3.1 以上")
+    @override_settings(DEBUG=True)
+    async def test_no_sync_adaption(self):
+        # DEBUG 时 Django 对每个需要转换的中间件记录 "Synchronous middleware ... adapted."
+        with mock.patch("django.core.handlers.base.logger") as log:
+            response = await self.async_client.get("/api/async/books/")
+        self.assertEqual(response.status_code, 200)
+        adapted = [call for call in log.debug.call_args_list if "adapted" in call[0][0]]
+        self.assertEqual(adapted, [])
+        # 线程池中执行的查询同样被统计
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+
+        async def get_response(request):
+            return HttpResponse()
+
+        for middleware in (TimingMiddleware, ReplicaRoutingMiddleware):
+            self.assertTrue(asyncio.iscoroutinefunction(middleware(get_response)))
+            self.assertFalse(asyncio.iscoroutinefunction(middleware(lambda request: HttpResponse())))
+
+
+class ConditionalGetTest(TestCase):
+    """
+    数据没有变化时按 If-None-Match / If-Modified-Since 返回 304
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(books=3, presses=1, authors=2)
+
+    def setUp(self):
+        get_response_cache().invalidate()
+        # 最后修改时间在一分钟以前
+        DataVersion.objects.update(update_time=timezone.now() - timedelta(minutes=1))
+
+    def test_if_none_match(self):
+        response = self.client.get("/api/v2/books/")
+        etag = response["ETag"]
+        self.assertEqual(self.client.get("/api/v2/books/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # 不同的 Accept  不同的 ETag
+        self.assertEqual(self.client.get("/api/v2/books/", HTTP_IF_NONE_MATCH=etag,
+                                         HTTP_ACCEPT="application/vnd.columnar+json").status_code, 200)
+        DataVersion.bump(Book)
+        response = self.client.get("/api/v2/books/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get("/api/v2/books/")["Last-Modified"]
+        self.assertEqual(self.client.get("/api/v2/books/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        earlier = http_date(time.time() - 3600)
+        self.assertEqual(self.client.get("/api/v2/books/", HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+    def test_same_second(self):
+        # 修改发生在当前这一秒内  Last-Modified 无法区分之后的修改  只使用 ETag
+        DataVersion.bump(Book)
+        response = self.client.get("/api/v2/books/")
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(self.client.get("/api/v2/books/", HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+        self.assertEqual(self.client.get("/api/v2/books/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+
+class RendererTest(TestCase):
+
+    def setUp(self):
+        seed_catalog(books=30, presses=2, authors=3)
+        get_response_cache().invalidate()
+
+    def test_columnar(self):
+        expected = self.client.get("/api/books/").json()["results"]
+        response = self.client.get("/api/books/", HTTP_ACCEPT="application/vnd.columnar+json")
+        self.assertEqual(response["Content-Type"], "application/vnd.columnar+json")
+        results = response.json()["results"]
+        self.assertEqual([dict(zip(results["columns"], row)) for row in results["rows"]], expected)
+
+    @skipIf(msgpack is None, "没有安装 msgpack")
+    def test_msgpack(self):
+        expected = self.client.get("/api/books/").json()
+        response = self.client.get("/api/books/?format=msgpack")
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), expected)
+
+    def test_gzip(self):
+        response = self.client.get("/api/books/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].startswith("W/"))
+        self.assertEqual(json.loads(gzip.decompress(response.content).decode())["status"], 200)
+        # 导出的 CSV 逐块压缩
+        response = self.client.get("/api/v2/books/export/?type=csv", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(gzip.decompress(b"".join(response.streaming_content)).decode().startswith("book_name"))
+
+    def test_range_not_compressed(self):
+        # Range 请求的响应与媒体文件不压缩  压缩后 Content-Range 中的位置不再正确
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, "data.json"), "w") as f:
+                f.write(json.dumps(list(range(2000))))
+            middleware = CompressionMiddleware()
+            request = RequestFactory().get("/media/data.json", HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=0-1999")
+            response = middleware.process_response(request, serve_media(request, "data.json", document_root=root))
+            self.assertEqual(response.status_code, 206)
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertEqual(len(b"".join(response.streaming_content)), 2000)
+
+            request = RequestFactory().get("/media/data.json", HTTP_ACCEPT_ENCODING="gzip")
+            response = middleware.process_response(request, serve_media(request, "data.json", document_root=root))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header("Content-Encoding"))
+            response.close()
+
+
+class MediaTest(TestCase):
+    """
+    Range / If-Range / 416 与 Cache-Control
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        with open(os.path.join(self.root, "a.txt"), "wb") as f:
+            f.write(b"0123456789")
+        open(os.path.join(self.root, "empty.txt"), "wb").close()
+        self.mtime = int(os.stat(os.path.join(self.root, "a.txt")).st_mtime)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def get(self, path, **extra):
+        response = serve_media(RequestFactory().get("/media/" + path, **extra), path, document_root=self.root)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_range(self):
+        response, content = self.get("a.txt", HTTP_RANGE="bytes=2-4")
+        self.assertEqual((response.status_code, content, response["Content-Range"]), (206, b"234", "bytes 2-4/10"))
+        response, content = self.get("a.txt", HTTP_RANGE="bytes=-3")
+        self.assertEqual((response.status_code, content), (206, b"789"))
+        # 不支持的格式返回完整的文件
+        response, content = self.get("a.txt", HTTP_RANGE="bytes=0-1,4-5")
+        self.assertEqual((response.status_code, content), (200, b"0123456789"))
+
+    def test_unsatisfiable(self):
+        response, _ = self.get("a.txt", HTTP_RANGE="bytes=10-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */10"))
+        response, _ = self.get("empty.txt", HTTP_RANGE="bytes=0-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */0"))
+
+    def test_if_range(self):
+        etag = self.get("a.txt")[0]["ETag"]
+        for if_range, status in [(etag, 206), ('"other"', 200), ("W/" + etag, 200),
+                                 (http_date(self.mtime), 206), (http_date(self.mtime - 60), 200)]:
+            response, _ = self.get("a.txt", HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, status, if_range)
+
+    def test_cache_control(self):
+        name = "img/ab/ab%s.jpg" % ("0" * 62)
+        self.assertIn("immutable", _cache_control(name))
+        # 缩略图与默认图片的内容可能变化
+        self.assertNotIn("immutable", _cache_control("renditions/thumbnail/" + name))
+        self.assertNotIn("immutable", _cache_control("img/1.jpeg"))
+
+
+class StorageTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(books=2, presses=1, authors=1, seed=0)
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings_override = override_settings(MEDIA_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def age(self, name, seconds=3600):
+        # 修改时间改为一段时间以前  超过 MEDIA_RELEASE_GRACE
+        path = media_storage.path(name)
+        mtime = os.path.getmtime(path) - seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_release(self):
+        name = media_storage.save("img/dt.jpg", ContentFile(b"image"))
+        Book.objects.filter(pk=Book.objects.first().pk).update(pic=name)
+        self.age(name)
+        self.assertFalse(release(name, Book, Press))
+        Book.objects.filter(pic=name).update(pic="img/1.jpeg")
+        self.assertTrue(release(name, Book, Press))
+        self.assertFalse(media_storage.exists(name))
+
+    def test_recently_saved(self):
+        # 引用刚上传的文件的数据可能还没有提交
+        name = media_storage.save("img/dt.jpg", ContentFile(b"image"))
+        self.assertFalse(release(name, Book, Press))
+        # 重复上传相同的内容  刷新修改时间
+        self.age(name)
+        self.assertEqual(media_storage.save("img/other.jpg", ContentFile(b"image")), name)
+        self.assertFalse(release(name, Book, Press))
+        self.age(name)
+        self.assertTrue(release(name, Book, Press))
+
+    def test_default(self):
+        self.assertEqual(default_names(Book, Press), {"img/1.jpeg"})
+        name = media_storage.save("img/dt.jpg", ContentFile(b"image"))
+        self.age(name)
+        with mock.patch.object(Book._meta.get_field("pic"), "default", name):
+            self.assertFalse(release(name, Book, Press))
+        self.assertTrue(media_storage.exists(name))
+
+
+class RenditionTest(TestCase):
+    """
+    缩略图的文件名与存在检查的缓存
+    """
+
+    def setUp(self):
+        renditions._ready.clear()
+        renditions._missing.clear()
+
+    def test_name_keeps_extension(self):
+        self.assertEqual(renditions.rendition_name("img/dt.png", "thumbnail"), "renditions/thumbnail/img/dt.png.jpg")
+        self.assertNotEqual(renditions.rendition_name("img/dt.png", "card"),
+                            renditions.rendition_name("img/dt.jpg", "card"))
+
+    def test_missing_cached(self):
+        storage = mock.Mock()
+        storage.exists.return_value = False
+        for _ in range(3):
+            self.assertFalse(renditions.is_ready(storage, "renditions/thumbnail/img/1.jpeg.jpg"))
+        self.assertEqual(storage.exists.call_count, 1)
+        # 超过有效时间后重新检查
+        with mock.patch("utils.cache.time.monotonic", return_value=time.monotonic() + 3600):
+            storage.exists.return_value = True
+            self.assertTrue(renditions.is_ready(storage, "renditions/thumbnail/img/1.jpeg.jpg"))
+        self.assertEqual(storage.exists.call_count, 2)
+
+    def test_bounded(self):
+        storage = mock.Mock()
+        storage.exists.return_value = False
+        with mock.patch.object(renditions._missing, "max_size", 10):
+            for index in range(50):
+                renditions.is_ready(storage, "renditions/thumbnail/img/%s.jpg" % index)
+            self.assertEqual(len(renditions._missing), 10)
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = HashedFileSystemStorage(location=root)
+            buffer = BytesIO()
+            Image.new("RGB", (400, 300), "red").save(buffer, "PNG")
+            name = storage.save("img/dt.png", ContentFile(buffer.getvalue()))
+            target = renditions.rendition_name(name, "thumbnail")
+            self.assertFalse(renditions.is_ready(storage, target))
+            renditions.generate_renditions(storage, name)
+            self.assertTrue(renditions.is_ready(storage, target))
+            self.assertEqual(Image.open(storage.path(target)).size[0], 150)
+            renditions.delete_renditions(storage, name)
+            self.assertFalse(renditions.is_ready(storage, target))
+
+
+class DatabaseProfileTest(TestCase):
+    """
+    DB_PROFILE=sqlite_tuned 的配置  建立连接时执行 PRAGMAS
+    """
+
+    def load_settings(self, profile):
+        with mock.patch.dict(os.environ, {"DB_PROFILE": profile}):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, "drf_day3", "settings.py"))["DATABASES"]["default"]
+
+    def test_profiles(self):
+        self.assertNotIn("PRAGMAS", self.load_settings("default"))
+        tuned = self.load_settings("sqlite_tuned")
+        self.assertEqual((tuned["CONN_MAX_AGE"], tuned["OPTIONS"]["timeout"]), (600, 20))
+        self.assertEqual(tuned["PRAGMAS"]["journal_mode"], "WAL")
+
+    def test_pragmas(self):
+        tuned = self.load_settings("sqlite_tuned")
+        with tempfile.TemporaryDirectory() as root:
+            settings_dict = dict(connection.settings_dict, NAME=os.path.join(root, "tuned.sqlite3"),
+                                 OPTIONS=tuned["OPTIONS"], PRAGMAS=tuned["PRAGMAS"])
+            wrapper = type(connections["default"])(settings_dict, alias="tuned")
+            try:
+                with wrapper.cursor() as cursor:
+                    values = {}
+                    for key in ("journal_mode", "synchronous", "cache_size", "temp_store", "busy_timeout"):
+                        cursor.execute("PRAGMA %s" % key)
+                        values[key] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        # synchronous NORMAL 为 1  temp_store MEMORY 为 2
+        self.assertEqual(values, {"journal_mode": "wal", "synchronous": 1, "cache_size": -64000,
+                                  "temp_store": 2, "busy_timeout": 20000})
+
+    def test_without_pragmas(self):
+        # 没有配置 PRAGMAS 或不是 sqlite 时不执行任何语句
+        for vendor, settings_dict in (("sqlite", {}), ("postgresql", {"PRAGMAS": {"journal_mode": "WAL"}})):
+            wrapper = mock.Mock(vendor=vendor, settings_dict=settings_dict)
+            apply_sqlite_pragmas(sender=None, connection=wrapper)
+            wrapper.cursor.assert_not_called()
+
+
+class TimingTest(TestCase):
+
+    def test_server_timing_and_metrics(self):
+        seed_catalog(books=5, presses=2, authors=3)
+        get_response_cache().invalidate()
+        metrics.reset()
+        response = self.client.get("/api/v2/books/")
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=')
+
+        content = self.client.get("/metrics/").content.decode()
+        self.assertIn('http_requests_total{route="/api/v2/books/",method="GET",status="200"} 1', content)
+        self.assertIn("response_cache_misses_total", content)
+
+
+class ExceptionLoggingTest(TestCase):
+
+    def test_validation_error_logged(self):
+        press = Press.objects.create(press_name="人民出版社", address="北京")
+        # drf 处理的异常与原来一样重新抛出
+        with self.assertLogs("utils.exceptions", "ERROR") as logs, self.assertLogs("django.request", "ERROR"), \
+                self.assertRaises(ValidationError):
+            self.client.post("/api/v2/books/", {"book_name": "图书1", "price": "1.00",
+                                                "publish": press.pk}, content_type="application/json")
+        record = logs.records[0]
+        self.assertEqual((record.levelname, record.view, record.method, record.status),
+                         ("ERROR", "BookAPIViewV2", "POST", 500))
+
+    def test_dedupe(self):
+        dedupe = DedupeFilter(window=60, burst=2)
+        record = logging.makeLogRecord({"name": "api", "msg": "错误", "exc_type": "ValueError"})
+        self.assertEqual([dedupe.filter(record) for _ in range(5)], [True, True, False, False, False])
+        # 窗口过期后的第一条日志带上被丢弃的次数
+        for entry in dedupe.seen.values():
+            entry[0] -= 60
+        self.assertTrue(dedupe.filter(record))
+        self.assertEqual(record.repeated, 3)
+
+    def test_listener_per_process(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "api.log")
+            handler = AsyncHandler(path)
+            # 第一次写日志时才启动后台线程
+            self.assertIsNone(handler.listener)
+            handler.handle(logging.makeLogRecord({"msg": "父进程"}))
+            parent = handler.listener
+            self.assertEqual(handler._pid, os.getpid())
+            # 模拟 fork 出的子进程  后台线程与队列都属于父进程
+            parent.stop()
+            handler._pid = -1
+            handler.handle(logging.makeLogRecord({"msg": "子进程"}))
+            self.assertIsNot(handler.listener, parent)
+            handler.close()
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(f.read().split(), ["父进程", "子进程"])
+
+
+class SearchTest(TestCase):
+    """
+    全文索引随写入同步更新
+    """
+
+    def setUp(self):
+        get_response_cache().invalidate()
+        self.press = Press.objects.create(press_name="人民出版社", address="北京")
+        self.author = Author.objects.create(author_name="鲁迅", age=50)
+        self.book = Book.objects.create(book_name="呐喊", price="20.00", publish=self.press)
+        self.book.authors.add(self.author)
+        Book.objects.create(book_name="北京游记", price="30.00", publish=self.press)
+
+    def search(self, query):
+        get_response_cache().invalidate()
+        response = self.client.get("/api/v2/books/search/", {"q": query})
+        return [book["book_name"] for book in response.data["results"]]
+
+    def test_search(self):
+        self.assertEqual(self.search("呐喊"), ["呐喊"])
+        self.assertEqual(self.search("鲁迅"), ["呐喊"])
+        # 图书名的权重高于出版社地址
+        self.assertEqual(self.search("北京"), ["北京游记", "呐喊"])
+        self.assertEqual(self.search("人民 鲁"), ["呐喊"])
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get("/api/v2/books/search/").status_code, 400)
+
+    def test_sync(self):
+        self.press.press_name = "商务印书馆"
+        self.press.save()
+        self.assertEqual(self.search("商务"), ["北京游记", "呐喊"])  # 相关度相同时新的图书在前
+
+        self.author.author_name = "周树人"
+        self.author.save()
+        self.assertEqual(self.search("树人"), ["呐喊"])
+
+        self.client.post("/api/v2/books/", [{"book_name": "彷徨小说集", "price": "9.00", "publish": self.press.pk,
+                                            "authors": [self.author.pk]}], content_type="application/json")
+        self.assertEqual(self.search("彷徨"), ["彷徨小说集"])
+
+        self.client.delete("/api/v2/books/%s/" % self.book.pk)
+        self.assertEqual(self.search("呐喊"), [])
+
+    def test_migration(self):
+        # 0005 中固定的 SQL 与 api.search 生成的索引相同
+        migration = importlib.import_module("api.migrations.0005_book_search_index")
+        schema_editor = mock.Mock(connection=connection)
+        migration.drop_search_index(None, schema_editor)
+        migration.create_search_index(None, schema_editor)
+        with connection.cursor() as cursor:
+            sql = "SELECT rowid, book_name, press_name, address, authors FROM bz_book_search ORDER BY rowid"
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+            self.assertEqual(search.rebuild(connection), 2)
+            cursor.execute(sql)
+            self.assertEqual(rows, cursor.fetchall())
+        self.assertEqual(self.search("鲁迅"), ["呐喊"])
+
+
+class ListingTest(TestCase):
+    """
+    读模型随写入同步更新  ?source=listing 的输出与图书表相同
+    """
+
+    def setUp(self):
+        seed_catalog(books=20, presses=3, authors=5)
+
+    def get(self, url):
+        get_response_cache().invalidate()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        data.pop("next", None)
+        return data
+
+    def test_parity(self):
+        for url in ["/api/v2/books/?page_size=10&expand=publish,authors", "/api/v2/books/?ordering=-price&page_size=5",
+                    "/api/v2/books/?price_min=5&ordering=price&fields=book_name,price&page_size=50"]:
+            self.assertEqual(self.get(url + "&source=listing"), self.get(url))
+
+    def test_sync(self):
+        press = Press.objects.first()
+        press.press_name = "商务印书馆"
+        press.save()
+        author = Author.objects.first()
+        author.detail.phone = "13800000000"
+        author.detail.save()
+        book_ids = list(Book.alive.values_list("pk", flat=True)[:3])
+        self.client.patch("/api/v2/books/", [{"pk": book_ids[0], "price": "8.00", "authors": [author.pk]}],
+                          content_type="application/json")
+        self.client.delete("/api/v2/books/", {"ids": book_ids[1:]}, content_type="application/json")
+        self.client.post("/api/v2/books/", [{"book_name": "彷徨小说集", "price": "9.00", "publish": press.pk,
+                                            "authors": [author.pk]}], content_type="application/json")
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def test_dedupe_media(self):
+        # dedupe_media 通过 update() 修改图片  读模型同样要更新
+        with tempfile.TemporaryDirectory() as root, override_settings(MEDIA_ROOT=root):
+            os.makedirs(os.path.join(root, "img"))
+            for name in ("dt.jpg", "1.jpeg"):
+                with open(os.path.join(root, "img", name), "wb") as f:
+                    f.write(b"image")
+            press = Press.objects.first()
+            press.pic = "img/dt.jpg"
+            press.save()
+            Book.alive.filter(pk__in=Book.alive.values("pk")[:2]).update(pic="img/dt.jpg")
+            listing.sync_books(Book.alive.values_list("pk", flat=True))
+            call_command("dedupe_media", stdout=StringIO())
+            # 默认图片由其他图书共用  保留
+            self.assertTrue(os.path.exists(os.path.join(root, "img", "1.jpeg")))
+        self.assertFalse(Book.objects.filter(pic="img/dt.jpg").exists())
+        self.assertTrue(Book.objects.filter(pic="img/1.jpeg").exists())
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
+
+    def test_migration(self):
+        # 0007 使用历史模型生成读模型  结果与 api.listing 相同
+        Book.objects.filter(pk=Book.alive.first().pk).soft_delete()
+        BookListing.objects.all().delete()
+        migration = importlib.import_module("api.migrations.0007_book_listing")
+        apps = MigrationLoader(connection).project_state(("api", "0007_book_listing")).apps
+        # sqlite 的 schema_editor 不能在测试的事务中使用  只需要 connection
+        migration.build_listing(apps, mock.Mock(connection=connection))
+        self.assertEqual(BookListing.objects.count(), Book.alive.count())
+        self.assertEqual(listing.verify(), {"missing": [], "stale": [], "extra": []})
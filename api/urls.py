@@ -1,3 +1,4 @@
+import django
 from django.urls import path
 
 from api import views
@@ -7,5 +8,19 @@ urlpatterns = [
     path("books/<str:id>/", views.BookAPIView.as_view()),
 
     path("v2/books/", views.BookAPIViewV2.as_view()),
+    # 流式导出与检索需要放在 <str:id> 的前面
+    path("v2/books/export/", views.BookExportAPIView.as_view()),
+    path("v2/books/search/", views.BookSearchAPIView.as_view()),
     path("v2/books/<str:id>/", views.BookAPIViewV2.as_view()),
 ]
+
+# 异步视图需要 Django 3.1 以上  通过 asgi.py 部署时使用
+if django.VERSION >= (3, 1):
+    from api import async_views
+
+    urlpatterns += [
+        path("async/books/", async_views.book_list),
+        path("async/books/<str:id>/", async_views.book_detail),
+        path("async/v2/books/", async_views.book_list_v2),
+        path("async/v2/books/<str:id>/", async_views.book_detail_v2),
+    ]
@@ -1,19 +1,35 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 from rest_framework import status
-from api.models import Book
-from api.serializers import BookModelSerializer, BookDeModelSerializer, BookModelSerializerV2
+from django.db.models import Case, IntegerField, Q, Value, When
+from api import listing, search
+from api.conditional import ConditionalGetMixin
+from api.filters import BookFilterMixin
+from api.models import Book, BookListing, DataVersion
+from api.serializers import BookModelSerializer, BookDeModelSerializer, BookModelSerializerV2, BookListingSerializer
+from utils.cache import CachedResponseMixin
+from utils.pagination import BookCursorPagination
+from utils.prefetch import setup_eager_loading
 from utils.response import APIResponse
+from utils.values_serializer import serialize
 
 
-class BookAPIView(APIView):
+class BookAPIView(ConditionalGetMixin, CachedResponseMixin, APIView):
 
     def get(self, request, *args, **kwargs):
         book_id = kwargs.get("id")
         if book_id:
 
-            book = Book.objects.get(pk=book_id)
-            book = BookModelSerializer(book).data
+            # ?fields= / ?expand= 选择输出的字段  没有输出的关联不会加载
+            context = {"query_params": request.query_params}
+            book = setup_eager_loading(Book.alive.all(), BookModelSerializer(context=context)).get(pk=book_id)
+            book = BookModelSerializer(book, context=context).data
             return Response({
                 "status": status.HTTP_200_OK,
                 "message": "查询单个图书成功",
@@ -21,8 +37,9 @@ class BookAPIView(APIView):
             })
 
         else:
-            book_list = Book.objects.all()
-            book_list = BookModelSerializer(book_list, many=True).data
+            # 只读的列表使用 values() 快速序列化  输出与 BookModelSerializer 一致
+            book_list = serialize(BookModelSerializer(context={"query_params": request.query_params}),
+                                  Book.alive.all())
             return Response({
                 "status": status.HTTP_200_OK,
                 "message": "查询所有图书成功",
@@ -49,13 +66,14 @@ class BookAPIView(APIView):
             "result": BookModelSerializer(book_obj).data
         })
 
-class BookAPIViewV2(APIView):
+class BookAPIViewV2(ConditionalGetMixin, CachedResponseMixin, BookFilterMixin, APIView):
 
     def get(self, request, *args, **kwargs):
         book_id = kwargs.get("id")
+        context = {"query_params": request.query_params}
         if book_id:
-            book_obj = Book.objects.filter(pk=book_id, is_delete=False)
-            book_ser = BookModelSerializerV2(book_obj,many=False).data
+            book_obj = setup_eager_loading(Book.alive.filter(pk=book_id), BookModelSerializerV2(context=context))
+            book_ser = BookModelSerializerV2(book_obj,many=False,context=context).data
             # return Response({
             #     "status": status.HTTP_200_OK,
             #     "message": "查询单个图书成功",
@@ -64,8 +82,21 @@ class BookAPIViewV2(APIView):
             return APIResponse(results=book_ser)
 
         else:
-            book_list = Book.objects.filter(is_delete=False)
-            book_list_ser = BookModelSerializerV2(book_list, many=True).data
+            if listing.use_listing(request, self):
+                # ?source=listing 从读模型查询  出版社与作者都在同一行中  一次索引扫描
+                serializer_class = BookListingSerializer
+                book_list = self.filter_queryset(BookListing.objects.all())
+            else:
+                serializer_class = BookModelSerializerV2
+                book_list = setup_eager_loading(self.filter_queryset(Book.alive.all()),
+                                                BookModelSerializerV2(context=context))
+            # 携带了分页参数时按游标分页返回
+            paginator = BookCursorPagination()
+            page = paginator.paginate_queryset(book_list, request, view=self)
+            if page is not None:
+                return paginator.get_paginated_response(serializer_class(page, many=True, context=context).data)
+
+            book_list_ser = serialize(serializer_class(context=context), book_list)
             # return Response({
             #     "status": status.HTTP_200_OK,
             #     "message": "查询所有图书成功",
@@ -121,8 +152,12 @@ class BookAPIViewV2(APIView):
             ids = request.data.get("ids")
 
         # 判断传递过来的图书的id是否在数据库  且还未删除
-        response = Book.objects.filter(pk__in=ids, is_delete=False).update(is_delete=True)
+        response = Book.alive.filter(pk__in=ids).soft_delete()
         if response:
+            DataVersion.bump(Book)
+            book_ids = [Book._meta.pk.to_python(pk) for pk in ids]
+            search.remove_books(book_ids)
+            listing.remove_books(book_ids)
             return Response({
                 "status": status.HTTP_200_OK,
                 "message": "删除成功"
@@ -233,16 +268,27 @@ class BookAPIViewV2(APIView):
 
         # 对传递过来的id与request_data进行筛选 id对应的图书是否存在
         # 如果id对应的图书不存在，把id和对应的request_data移除
+        # 通过 in_bulk 一次查询出所有要修改的图书
+        pk_field = Book._meta.pk
+        pks = {}
+        for id in books_id:
+            try:
+                pks[id] = pk_field.to_python(id)
+            except DjangoValidationError:
+                continue
+        book_dict = Book.objects.in_bulk(list(set(pks.values())))
+
         book_list = []
         new_data = []
+        missing = []
         # 禁止在循环中对列表的长度做改变
         for index,id in enumerate(books_id):
-            try:
-                book=Book.objects.get(pk=id)
-                book_list.append(book)
-                new_data.append(request_data[index])
-            except:
+            book = book_dict.get(pks.get(id))
+            if book is None:
+                missing.append(id)
                 continue
+            book_list.append(book)
+            new_data.append(request_data[index])
         # print(new_data)      #新数据
         # print(book_list)     #表中数据
 
@@ -252,7 +298,112 @@ class BookAPIViewV2(APIView):
         return Response({
             "status":status.HTTP_200_OK,
             "message":'修改成功',
+            # 不存在的图书id
+            "missing": missing,
         })
 
 
+class BookSearchAPIView(ConditionalGetMixin, CachedResponseMixin, APIView):
+    """
+    全文检索图书名、出版社名与地址、作者名  按相关度排序
+    v2/books/search/?q=关键字&page=1&page_size=20
+    sqlite 以外的数据库没有全文索引  按名称模糊匹配  按创建时间排序
+    """
+    page_size = 20
+    max_page_size = 100
 
+    def get_int(self, request, name, default, maximum=None):
+        try:
+            value = int(request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+        if value <= 0:
+            return default
+        return min(value, maximum) if maximum else value
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return APIResponse(status.HTTP_400_BAD_REQUEST, "缺少查询参数 q", http_status=status.HTTP_400_BAD_REQUEST)
+        page = self.get_int(request, "page", 1)
+        page_size = self.get_int(request, "page_size", self.page_size, self.max_page_size)
+        offset = (page - 1) * page_size
+
+        # 多取一条判断是否还有下一页
+        if search.is_enabled():
+            ids = search.search(query, offset=offset, limit=page_size + 1)
+        else:
+            condition = Q()
+            for term in query.split():
+                condition &= (Q(book_name__icontains=term) | Q(publish__press_name__icontains=term) |
+                              Q(publish__address__icontains=term) | Q(authors__author_name__icontains=term))
+            ids = list(Book.alive.filter(condition).order_by("-create_time", "-id")
+                       .values_list("pk", flat=True).distinct()[offset:offset + page_size + 1])
+
+        has_next = len(ids) > page_size
+        ids = ids[:page_size]
+        # 保持检索结果的顺序
+        ordering = Case(*[When(pk=pk, then=Value(index)) for index, pk in enumerate(ids)],
+                        output_field=IntegerField())
+        queryset = Book.alive.filter(pk__in=ids).order_by(ordering) if ids else Book.alive.none()
+        rows = serialize(BookModelSerializerV2(context={"query_params": request.query_params}), queryset)
+        return APIResponse(results=rows, page=page, next=page + 1 if has_next else None)
+
+
+class Echo(object):
+    """
+    csv.writer 需要一个可写对象  直接把写入的内容返回  交给流式响应输出
+    """
+
+    def write(self, value):
+        return value
+
+
+class BookExportAPIView(APIView):
+    """
+    流式导出全部图书  ?type=jsonl(默认) 或 ?type=csv  支持 ?fields=  忽略 ?expand=
+    分块从数据库读取  边序列化边写入响应  内存占用与图书数量无关
+    """
+    chunk_size = 2000
+    content_types = {
+        "jsonl": "application/x-ndjson",
+        "csv": "text/csv",
+    }
+
+    def get(self, request, *args, **kwargs):
+        export_type = request.query_params.get("type", "jsonl")
+        if export_type not in self.content_types:
+            return Response({
+                "status": status.HTTP_400_BAD_REQUEST,
+                "message": "不支持的导出格式",
+            })
+
+        # 只创建一个序列化器  逐行调用 to_representation  同样支持 ?fields=
+        # 不支持 ?expand=: Django 2.2 中 iterator() 会忽略 prefetch_related  展开作者时每一行都要查询
+        query_params = request.query_params.copy()
+        query_params.pop("expand", None)
+        book_ser = BookModelSerializerV2(context={"request": request, "query_params": query_params})
+        book_list = setup_eager_loading(Book.alive.order_by("id"), book_ser)
+        rows = (book_ser.to_representation(book) for book in book_list.iterator(chunk_size=self.chunk_size))
+
+        if export_type == "csv":
+            content = self.iter_csv(book_ser, rows)
+        else:
+            content = self.iter_jsonl(rows)
+
+        response = StreamingHttpResponse(content, content_type=self.content_types[export_type])
+        response["Content-Disposition"] = 'attachment; filename="books.%s"' % export_type
+        return response
+
+    def iter_jsonl(self, rows):
+        for row in rows:
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+    def iter_csv(self, book_ser, rows):
+        fields = [field.field_name for field in book_ser.fields.values() if not field.write_only]
+        writer = csv.DictWriter(Echo(), fieldnames=fields)
+        yield writer.writeheader()
+        for row in rows:
+            # 嵌套的数据(图片的各个尺寸)以 json 字符串写入一列
+            yield writer.writerow({key: json.dumps(value, cls=JSONEncoder, ensure_ascii=False)
+                                   if isinstance(value, (dict, list)) else value for key, value in row.items()})
@@ -0,0 +1,9 @@
+# 只读图书接口的异步版本  需要 Django 3.1 以上
+from api.async_views import api_response, serialize
+from api.models import Book
+from .serializers import BookModelSerializer
+
+
+async def book_list(request):
+    results = await serialize(BookModelSerializer, Book.alive.all())
+    return api_response(results=results)
@@ -1,24 +1,29 @@
 from rest_framework import serializers, exceptions
 
 from api.models import Book
-from api.serializers import BookListSerializer
+# 群增与群改使用 api 中的批量实现
+from api.serializers import BookListSerializer, PressModelSerializer
+from utils.dynamic_fields import DynamicFieldsMixin
+from utils.relations import BatchedPrimaryKeyRelatedField
+from utils.renditions import RenditionField
+from utils.timing import TimedSerializerMixin
 
-class BookListSerializer(serializers.ListSerializer):
-    # 使用此序列化器完成修改多个对象
-    def update(self, instance, validated_data):
-        for index, obj in enumerate(instance):
-            # 每遍历一次 就修改一个对象的数据
-            self.child.update(obj, validated_data[index])
+class BookModelSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    # 关联字段使用支持批量校验的主键字段
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+    pic_renditions = RenditionField(source="pic")
 
-        return instance
-
-class BookModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         # fields应该填写哪些字段  应该填写序列化与反序列化字段的并集
-        fields = ("book_name", "price", "publish", "authors", "pic")
+        fields = ("book_name", "price", "publish", "authors", "pic", "pic_renditions")
         # 为修改多个图书对象提供ListSerializer
         list_serializer_class=BookListSerializer
+        # ?expand=publish,authors 时输出出版社与作者的信息
+        expandable_fields = {
+            "publish": PressModelSerializer(read_only=True),
+            "authors": serializers.ReadOnlyField(source="author_list"),
+        }
 
         # 通过此参数指定哪些字段是参与序列化的  哪些字段是参与反序列化的
         extra_kwargs = {
@@ -47,7 +52,6 @@ class BookModelSerializer(serializers.ModelSerializer):
         # 自定义用户名校验规则
         if "1" in value:
             raise exceptions.ValidationError("图书名含有敏感字")
-        print(self.context.get("request"))
         return value
 
     # 全局校验钩子  可以通过attrs获取到前台发送的所有的参数
@@ -1,3 +1,114 @@
-from django.test import TestCase
+from itertools import combinations
+
+from django.test import RequestFactory, TestCase
+from rest_framework.request import Request
 
 # Create your tests here.
+from api.models import Author, Book, Press
+from api.seeding import seed_catalog
+from api.views import BookAPIViewV2
+from utils.cache import get_response_cache
+from utils.exceptions import InvalidQuery
+from utils.pagination import BookCursorPagination
+from utils.testing import QueryCountMixin
+
+
+class QueryCountTest(QueryCountMixin, TestCase):
+    """
+    接口的查询次数不能随数据量增加
+    """
+    urls = ["/day4/books/", "/day4/gen/", "/day4/gen/?page_size=20", "/day4/list/", "/day4/set/"]
+
+    def test_constant_queries(self):
+        seed_catalog(books=3, presses=2, authors=3)
+        before = {url: self.count_queries(url) for url in self.urls}
+        seed_catalog(books=30, presses=5, authors=10, seed=1)
+        after = {url: self.count_queries(url) for url in self.urls}
+        self.assertEqual(before, after)
+
+
+class FilterTest(TestCase):
+    """
+    过滤与排序只允许使用有索引的字段
+    """
+
+    def setUp(self):
+        get_response_cache().invalidate()
+        self.press = Press.objects.create(press_name="人民出版社", address="北京")
+        other = Press.objects.create(press_name="清华出版社", address="北京")
+        self.author = Author.objects.create(author_name="张三", age=30)
+        for index, (price, publish) in enumerate([("10.00", self.press), ("30.00", other), ("20.00", self.press)]):
+            book = Book.objects.create(book_name="图书%s" % "ABC"[index], price=price, publish=publish)
+            if publish == self.press:
+                book.authors.add(self.author)
+        Book.objects.filter(price="30.00").update(status=False)
+
+    def prices(self, url):
+        get_response_cache().invalidate()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # 没有分页时 ListAPIView 直接返回列表
+        books = response.data["results"] if isinstance(response.data, dict) else response.data
+        return [book["price"] for book in books]
+
+    def test_filter(self):
+        self.assertEqual(sorted(self.prices("/day4/list/?price_min=15")), ["20.00", "30.00"])
+        self.assertEqual(sorted(self.prices("/day4/list/?price_min=15&price_max=25")), ["20.00"])
+        self.assertEqual(sorted(self.prices("/day4/set/?publish=%s" % self.press.pk)), ["10.00", "20.00"])
+        self.assertEqual(sorted(self.prices("/api/v2/books/?author=%s" % self.author.pk)), ["10.00", "20.00"])
+        self.assertEqual(self.prices("/day4/list/?status=false"), ["30.00"])
+        self.assertEqual(self.prices("/day4/list/?created_after=2999-01-01"), [])
+
+    def test_ordering(self):
+        self.assertEqual(self.prices("/day4/list/?ordering=-price"), ["30.00", "20.00", "10.00"])
+        # 游标分页使用相同的排序
+        response = self.client.get("/api/v2/books/?ordering=price&page_size=2")
+        self.assertEqual([book["price"] for book in response.data["results"]], ["10.00", "20.00"])
+        self.assertEqual(self.prices(response.data["next"]), ["30.00"])
+
+    def assert_rejected(self, url):
+        # 服务端拒绝的查询参数  返回 400 而不是 500
+        with self.assertLogs("utils.exceptions", "INFO"), self.assertLogs("django.request", "WARNING"):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 400, url)
+        self.assertEqual(response.json()["status"], 400)
+
+    def test_reject(self):
+        for url in ["/day4/list/?ordering=book_name", "/day4/list/?ordering=price,id", "/day4/set/?price_min=abc"]:
+            self.assert_rejected(url)
+
+    def test_reject_sort(self):
+        # 范围过滤与其他字段的排序(包括分页默认按 create_time 排序)需要临时排序
+        for url in ["/api/v2/books/?price_min=10&ordering=-create_time", "/api/v2/books/?price_min=10&page_size=2",
+                    "/api/v2/books/?created_after=2000-01-01&ordering=price", "/day4/list/?ordering=id"]:
+            self.assert_rejected(url)
+        self.assertEqual(self.prices("/day4/list/?price_min=15&ordering=price"), ["20.00", "30.00"])
+
+    def test_plan(self):
+        # 允许的过滤与排序组合都直接按索引的顺序读取  执行计划中没有临时的 B-tree 排序
+        filters = {
+            "price_min": "10", "price_max": "50", "publish": str(self.press.pk), "author": str(self.author.pk),
+            "status": "true", "created_after": "2000-01-01", "created_before": "2999-01-01",
+        }
+        # 多个值的 in
+        values = dict(filters, publish="%s,%s" % (self.press.pk, self.press.pk + 1))
+        orderings = [None, "create_time", "-create_time", "price", "-price"]
+        allowed = 0
+        for params in [filters, values]:
+            for count in range(3):
+                for names in combinations(sorted(params), count):
+                    for ordering in orderings:
+                        query = {name: params[name] for name in names}
+                        if ordering:
+                            query["ordering"] = ordering
+                        request = Request(RequestFactory().get("/api/v2/books/", query))
+                        view = BookAPIViewV2(request=request)
+                        try:
+                            queryset = view.filter_queryset(Book.alive.all())
+                            order_by = BookCursorPagination().get_ordering(request, queryset, view)
+                        except InvalidQuery:
+                            continue
+                        plan = queryset.order_by(*order_by)[:10].explain()
+                        self.assertNotIn("TEMP B-TREE", plan, query)
+                        allowed += 1
+        self.assertGreater(allowed, 20)
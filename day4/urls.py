@@ -1,3 +1,4 @@
+import django
 from django.urls import path
 
 from day4 import views
@@ -17,3 +18,11 @@ urlpatterns = [
     path("set/<str:id>/", views.BookGenericViewSet.as_view({"post": "user_login"})),
 
 ]
+
+# 异步视图需要 Django 3.1 以上
+if django.VERSION >= (3, 1):
+    from day4 import async_views
+
+    urlpatterns += [
+        path("async/books/", async_views.book_list),
+    ]
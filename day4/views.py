@@ -5,29 +5,47 @@ from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, CreateMode
 from rest_framework.views import APIView
 
 # Create your views here.
-from api.models import Book
+from api.conditional import ConditionalGetMixin
+from api.filters import BookFilterMixin
+from api.listing import use_listing
+from api.models import Book, BookListing
+from api.serializers import BookListingSerializer
+from utils.cache import CachedResponseMixin
+from utils.pagination import BookCursorPagination
+from utils.prefetch import EagerLoadingMixin
 from utils.response import APIResponse
+from utils.values_serializer import serialize
 from .serializers import BookModelSerializer
 
 
-class BookAPIView(APIView):
+class BookAPIView(ConditionalGetMixin, CachedResponseMixin, APIView):
     def get(self, request, *args, **kwargs):
-        book_list = Book.objects.filter(is_delete=False)
-        data_ser = BookModelSerializer(book_list, many=True).data
+        context = {"query_params": request.query_params}
+        if use_listing(request, self):
+            # ?source=listing 从读模型查询  输出相同
+            data_ser = serialize(BookListingSerializer(context=context), BookListing.objects.all())
+            return APIResponse(results=data_ser)
+        book_list = Book.alive.all()
+        data_ser = serialize(BookModelSerializer(context=context), book_list)
 
         return APIResponse(results=data_ser)
 
 # GenericAPIView继承了APIView, 两者完全兼容
 # 重点分析GenericAPIView 在APIView的基础上完成了哪些事情
-class BookGenericAPIView(GenericAPIView,
+class BookGenericAPIView(ConditionalGetMixin,
+                         CachedResponseMixin,
+                         EagerLoadingMixin,
+                         GenericAPIView,
                          ListModelMixin,
                          RetrieveModelMixin,
                          CreateModelMixin,
                          UpdateModelMixin,
                          DestroyModelMixin,):
     # 获取当前视图所操作的模型 与序列化器类
-    queryset = Book.objects.filter(is_delete=False)
+    queryset = Book.alive.all()
     serializer_class = BookModelSerializer  #指定使用的序列化器
+    # 携带 cursor 或 page_size 参数时使用游标分页
+    pagination_class = BookCursorPagination
     # 指定(重写，默认是pk)获取单条信息的主键的名称
     lookup_field = "id"
 
@@ -85,14 +103,18 @@ class BookGenericAPIView(GenericAPIView,
         return APIResponse(http_status=status.HTTP_200_OK)
 
 
-class BookListAPIVIew(generics.ListCreateAPIView, generics.DestroyAPIView):
-    queryset = Book.objects.filter(is_delete=False)
+class BookListAPIVIew(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin, BookFilterMixin,
+                      generics.ListCreateAPIView, generics.DestroyAPIView):
+    queryset = Book.alive.all()
     serializer_class = BookModelSerializer
+    pagination_class = BookCursorPagination
     lookup_field = "id"
 
-class BookGenericViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.filter(is_delete=False)
+class BookGenericViewSet(ConditionalGetMixin, CachedResponseMixin, EagerLoadingMixin, BookFilterMixin,
+                         viewsets.ModelViewSet):
+    queryset = Book.alive.all()
     serializer_class = BookModelSerializer
+    pagination_class = BookCursorPagination
     lookup_field = "id"
 
     # 如何确定post请求是需要登录
@@ -0,0 +1,22 @@
+"""
+ASGI config for drf_day3 project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+需要 Django 3.0 以上  异步视图需要 Django 3.1 以上
+
+    uvicorn drf_day3.asgi:application --workers 2
+"""
+
+import os
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+if django.VERSION < (3, 0):
+    raise ImproperlyConfigured("通过 ASGI 部署需要 Django 3.0 以上  当前版本 %s  请使用 wsgi.py" % django.get_version())
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drf_day3.settings")
+
+application = get_asgi_application()
@@ -11,6 +11,9 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
+
+import django
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -43,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 请求的耗时统计  放在最前面统计完整的耗时
+    'utils.timing.TimingMiddleware',
+    # 按 Accept-Encoding 压缩较大的响应  br / gzip
+    'utils.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +57,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # 读写分离  安全的请求读取从库
+    'utils.routers.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'drf_day3.urls'
@@ -73,6 +82,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'drf_day3.wsgi.application'
 
+# Django 3.0 以上可以通过 asgi.py 部署  Django 2.x 没有 django.core.asgi
+if django.VERSION >= (3, 0):
+    ASGI_APPLICATION = 'drf_day3.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
@@ -84,6 +97,50 @@ DATABASES = {
     }
 }
 
+# 数据库的配置方案  通过环境变量 DB_PROFILE 选择
+#   default: sqlite3 的默认配置
+#   sqlite_tuned: WAL 日志、调整后的 PRAGMA、忙等待超时以及持久连接  适合多个进程并发读写
+DB_PROFILE = os.environ.get("DB_PROFILE", "default")
+
+if DB_PROFILE == "sqlite_tuned":
+    DATABASES['default'].update({
+        # 连接保持 10 分钟  不再每个请求都重新连接
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # 数据库被锁时等待的秒数  而不是立即报错 database is locked
+            'timeout': 20,
+        },
+        # 建立连接时执行的 PRAGMA  由 utils.db 处理
+        'PRAGMAS': {
+            # 写不阻塞读  读不阻塞写
+            'journal_mode': 'WAL',
+            # WAL 模式下 NORMAL 在断电时才可能丢失最后的事务  不会损坏数据库
+            'synchronous': 'NORMAL',
+            # 负数单位为 KB  64MB 的页缓存
+            'cache_size': -64000,
+            # 256MB 的内存映射读取
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+            'busy_timeout': 20000,
+        },
+    })
+
+# 读写分离  设置环境变量 DB_REPLICA=1 后 GET 请求读取从库 db_replica.sqlite3
+# 本地使用 python manage.py sync_replica 将主库复制到从库
+DATABASE_REPLICAS = []
+if os.environ.get("DB_REPLICA"):
+    DATABASES['replica'] = dict(DATABASES['default'], **{
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        # 测试时从库直接使用主库的测试数据库
+        'TEST': {'MIRROR': 'default'},
+    })
+    DATABASE_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['utils.routers.ReplicaRouter']
+
+# 写入数据后多少秒内该客户端的请求都读取主库
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -127,9 +184,93 @@ STATIC_URL = '/static/'
 REST_FRAMEWORK={
     # 自定义异常的方法
     'EXCEPTION_HANDLER': 'utils.exceptions.exception_handler',
+    # 统计渲染的耗时  通过 Accept 选择列式 JSON 与 MessagePack(安装了 msgpack 时)
+    'DEFAULT_RENDERER_CLASSES': tuple(renderer for renderer in (
+        'utils.timing.TimedJSONRenderer',
+        'utils.renderers.ColumnarJSONRenderer',
+        'utils.renderers.MessagePackRenderer' if find_spec('msgpack') else None,
+        'utils.timing.TimedBrowsableAPIRenderer',
+    ) if renderer),
+}
+
+# 日志由后台线程写入  相同的错误 60 秒内只记录前 5 条  LOG_FILE 为空时写入标准错误
+LOG_FILE = os.environ.get("LOG_FILE") or None
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "utils.logs.JsonFormatter"},
+    },
+    "filters": {
+        "dedupe": {"()": "utils.logs.DedupeFilter", "window": 60, "burst": 5},
+    },
+    "handlers": {
+        "async": {
+            "class": "utils.logs.AsyncHandler",
+            "filename": LOG_FILE,
+            "formatter": "json",
+            "filters": ["dedupe"],
+        },
+    },
+    "loggers": {
+        "utils": {"handlers": ["async"], "level": "INFO", "propagate": False},
+        "api": {"handlers": ["async"], "level": "INFO", "propagate": False},
+        # 4xx/5xx 的请求日志
+        "django.request": {"handlers": ["async"], "level": "WARNING", "propagate": False},
+    },
+}
+
+# 响应中返回 Server-Timing 头  以及允许访问 /metrics/ 的地址
+SERVER_TIMING = True
+METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+# 每个路由允许的查询次数  超过时记录警告  "*" 为默认的预算
+QUERY_BUDGETS = {
+    "*": 10,
+}
+
+# 小于此长度(字节)的响应不压缩  以及 brotli 的压缩等级(0 ~ 11)
+COMPRESS_MIN_LENGTH = 1024
+BROTLI_QUALITY = 5
+# 只压缩序列化器输出的格式
+COMPRESS_CONTENT_TYPES = (
+    "application/json",
+    "application/vnd.columnar+json",
+    "application/msgpack",
+    "application/x-ndjson",
+    "text/csv",
+)
+
+# 图书接口的响应缓存  BACKEND 可选 lru(进程内) / django(使用 CACHES 中 ALIAS 指定的缓存)
+RESPONSE_CACHE = {
+    "BACKEND": "lru",
+    "ALIAS": "default",
+    "MAX_SIZE": 512,
+    "TIMEOUT": 60,
 }
 
+# 上传图片后生成的缩略图尺寸 {名称: (最大宽度, 最大高度)}  以及生成缩略图的后台线程数
+IMAGE_RENDITIONS = {
+    "thumbnail": (150, 150),
+    "card": (480, 480),
+    "full": (1280, 1280),
+}
+RENDITION_WORKERS = 2
+# 缩略图是否存在的缓存数量  以及存在/不存在的结果的有效时间(秒)
+RENDITION_CACHE_SIZE = 10000
+RENDITION_READY_TIMEOUT = 86400
+RENDITION_MISSING_TIMEOUT = 60
+
 # 静态资源的路径
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
 MEDIA_URL = "/media/"
+
+# 媒体文件的访问  上传目录中按内容命名的原图永久缓存  其他文件的缓存时间(秒)
+MEDIA_HASHED_PREFIXES = ("img/",)
+MEDIA_CACHE_MAX_AGE = 3600
+# 最近保存或复用过的图片在这段时间(秒)内不删除  引用它的数据可能还没有提交
+MEDIA_RELEASE_GRACE = 60
+# 交给前端 web 服务器发送文件  None / "x-sendfile"(Apache) / "x-accel-redirect"(nginx)
+MEDIA_SENDFILE = None
+# nginx 中 internal 的 location  指向 MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = "/protected-media/"
@@ -13,16 +13,28 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import django
 from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
-from django.views.static import serve
 
 from drf_day3 import settings
+from utils.media import serve_media
+from utils.timing import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    url(r"^media/(?P<path>.*)", serve, {"document_root": settings.MEDIA_ROOT}),
+    url(r"^media/(?P<path>.*)", serve_media, {"document_root": settings.MEDIA_ROOT}),
     path("api/", include("api.urls")),
     path("day4/",include('day4.urls')),
-]
\ No newline at end of file
+    # Prometheus 格式的接口耗时统计
+    path("metrics/", metrics_view),
+]
+
+# 通过 asgi.py 部署时  异步读取媒体文件
+if django.VERSION >= (3, 1):
+    from api.async_views import media
+
+    urlpatterns += [
+        url(r"^async/media/(?P<path>.*)", media, {"document_root": settings.MEDIA_ROOT}),
+    ]
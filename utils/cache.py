@@ -0,0 +1,188 @@
+"""
+图书接口的响应缓存
+
+GET 请求的响应按 路径 + 查询参数 + Accept 缓存渲染后的内容
+增删改请求实际写入了数据(utils.writes)后整体失效  与响应的状态码无关
+缓存的后端通过 settings.RESPONSE_CACHE 配置:
+    BACKEND: "lru"  进程内的 LRU 缓存(默认)
+             "django"  使用 django 的缓存(locmem / 文件缓存等)  ALIAS 指定缓存的名称
+    MAX_SIZE: LRU 最多缓存的响应数量
+    TIMEOUT: 缓存的有效时间(秒)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from utils.writes import track_writes
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+DEFAULT_CONFIG = {
+    "BACKEND": "lru",
+    "ALIAS": "default",
+    "MAX_SIZE": 512,
+    "TIMEOUT": 60,
+}
+
+
+class LRUCache(object):
+    """
+    进程内的 LRU 缓存  超过数量淘汰最久未使用的数据  超过时间的数据视为不存在
+    """
+
+    def __init__(self, max_size=512, timeout=60):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCache(object):
+    """
+    使用 django 的缓存作为后端  多个进程共用同一份文件缓存时也能一起失效
+    失效时不逐个删除  而是增加版本号让旧的缓存全部无法命中
+    """
+    version_key = "response_cache:version"
+
+    def __init__(self, alias="default", timeout=60):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def _version(self):
+        return self.cache.get_or_set(self.version_key, 1, None)
+
+    def get(self, key):
+        return self.cache.get(key, version=self._version())
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout, version=self._version())
+
+    def clear(self):
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.set(self.version_key, 2, None)
+
+    def __len__(self):
+        # django 的缓存无法统计数量
+        return -1
+
+
+class ResponseCache(object):
+    """
+    缓存渲染后的响应  并统计命中与未命中的次数
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, request):
+        query = "&".join("%s=%s" % (key, ",".join(request.GET.getlist(key))) for key in sorted(request.GET))
+        # data_version 由条件请求设置  数据变化后旧的缓存不会再被命中
+        return "response_cache:%s?%s:%s:%s" % (request.path, query, request.META.get("HTTP_ACCEPT", ""),
+                                              getattr(request, "data_version", ""))
+
+    def get(self, request):
+        value = self.backend.get(self.make_key(request))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            return None
+        content, status, content_type = value
+        response = HttpResponse(content, status=status, content_type=content_type)
+        response["X-Cache"] = "HIT"
+        return response
+
+    def set(self, request, response):
+        response["X-Cache"] = "MISS"
+        value = (response.content, response.status_code, response.get("Content-Type"))
+        self.backend.set(self.make_key(request), value)
+
+    def invalidate(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {"hits": hits, "misses": misses, "size": len(self.backend)}
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        config = dict(DEFAULT_CONFIG, **getattr(settings, "RESPONSE_CACHE", {}))
+        if config["BACKEND"] == "django":
+            backend = DjangoCache(config["ALIAS"], config["TIMEOUT"])
+        else:
+            backend = LRUCache(config["MAX_SIZE"], config["TIMEOUT"])
+        _response_cache = ResponseCache(backend)
+    return _response_cache
+
+
+class CachedResponseMixin(object):
+    """
+    为视图提供响应缓存  GET 请求先查缓存  增删改写入了数据后清空缓存
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        cache = get_response_cache()
+        if request.method == "GET":
+            cached = cache.get(request)
+            if cached is not None:
+                return cached
+
+        with track_writes() as writes:
+            response = super().dispatch(request, *args, **kwargs)
+
+        if request.method == "GET":
+            if response.status_code == 200 and not response.streaming:
+                # DRF 的 Response 需要先渲染才能拿到内容
+                if hasattr(response, "render"):
+                    response.render()
+                cache.set(request, response)
+        elif writes:
+            cache.invalidate()
+        return response
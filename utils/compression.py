@@ -0,0 +1,68 @@
+"""
+按 Accept-Encoding 压缩响应
+
+优先使用 br(需要安装 brotli)  其次 gzip(Django 的 GZipMiddleware)
+小于 COMPRESS_MIN_LENGTH 的响应不压缩  压缩的开销大于节省的传输时间
+流式响应(导出)只使用 gzip 逐块压缩
+只压缩序列化器输出的格式(COMPRESS_CONTENT_TYPES)  媒体文件、Range 请求的响应(206)与 FileResponse 不压缩
+    压缩会改变内容的长度  Content-Range 中的位置不再正确
+"""
+import re
+
+from django.conf import settings
+from django.http import FileResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_br = re.compile(r"\bbr\b")
+
+# JSON、列格式的 JSON、MessagePack 与导出的 JSON Lines / CSV
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "application/vnd.columnar+json",
+    "application/msgpack",
+    "application/x-ndjson",
+    "text/csv",
+)
+
+
+def is_compressible(response):
+    if response.status_code == 206 or isinstance(response, FileResponse):
+        return False
+    if response.has_header("Content-Range") or response.has_header("Accept-Ranges"):
+        return False
+    content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+    return content_type in getattr(settings, "COMPRESS_CONTENT_TYPES", DEFAULT_CONTENT_TYPES)
+
+
+class CompressionMiddleware(GZipMiddleware):
+
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, "COMPRESS_MIN_LENGTH", 1024):
+            return response
+        if brotli is None or response.streaming or response.has_header("Content-Encoding"):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if not re_accepts_br.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            return super().process_response(request, response)
+
+        compressed = brotli.compress(response.content, quality=getattr(settings, "BROTLI_QUALITY", 5))
+        # 压缩后没有变小  返回原内容
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        # 内容的编码改变  强 ETag 改为弱 ETag  与 GZipMiddleware 的处理一致
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = "br"
+        return response
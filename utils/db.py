@@ -0,0 +1,16 @@
+# 建立数据库连接时执行 DATABASES 中配置的 PRAGMAS(只对 sqlite 生效)
+from django.db.backends.signals import connection_created
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    pragmas = connection.settings_dict.get("PRAGMAS")
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for key, value in pragmas.items():
+            cursor.execute("PRAGMA %s = %s" % (key, value))
+
+
+connection_created.connect(apply_sqlite_pragmas, dispatch_uid="utils.db.apply_sqlite_pragmas")
@@ -0,0 +1,92 @@
+"""
+通过查询参数选择序列化的字段
+
+    ?fields=book_name,price   只输出指定的字段
+    ?expand=publish,authors   额外输出 Meta.expandable_fields 中声明的关联字段
+
+序列化器中声明:
+    class Meta:
+        expandable_fields = {
+            "publish": PressModelSerializer(read_only=True),
+            "authors": serializers.ReadOnlyField(source="author_list"),
+        }
+
+字段在 get_fields 中裁剪  关联加载(utils.prefetch)与快速序列化(utils.values_serializer)
+都按裁剪后的字段分析  没有输出的字段不会产生 JOIN 与预加载
+只作用于最外层的序列化器(many=True 时的 child)  只读请求(GET 等)才生效  写入时字段不变
+没有 request 的视图通过 context={"query_params": request.query_params} 传递参数
+不存在的字段名会被忽略  plan_key 只由实际的字段组成  缓存的编译结果数量有上限
+"""
+import copy
+
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+# 按序列化器类缓存声明的字段名
+_field_names = {}
+
+
+def parse_names(value):
+    """ "a, b,,c" -> {"a", "b", "c"} """
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+class DynamicFieldsMixin(object):
+    fields_param = "fields"
+    expand_param = "expand"
+
+    def _is_root(self):
+        parent = getattr(self, "parent", None)
+        if parent is None:
+            return True
+        return isinstance(parent, serializers.ListSerializer) and getattr(parent, "parent", None) is None
+
+    def get_query_params(self):
+        if "query_params" in self.context:
+            return self.context["query_params"]
+        request = self.context.get("request")
+        if request is not None and request.method in SAFE_METHODS:
+            return request.query_params
+        return None
+
+    def get_known_fields(self):
+        # 裁剪之前的字段与可以展开的字段
+        cls = type(self)
+        if cls not in _field_names:
+            names = set(super().get_fields()) | set(getattr(self.Meta, "expandable_fields", {}))
+            _field_names[cls] = frozenset(names)
+        return _field_names[cls]
+
+    def get_requested_fields(self):
+        """
+        return: (要输出的字段 没有传递 fields 时为 None, 要展开的字段)  只包括存在的字段
+        """
+        params = self.get_query_params() if self._is_root() else None
+        if params is None:
+            return None, frozenset()
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        requested = parse_names(params.get(self.fields_param)) or None
+        expand = parse_names(params.get(self.expand_param)) & set(expandable)
+        if requested is not None:
+            requested = frozenset(requested & self.get_known_fields())
+        return requested, frozenset(expand)
+
+    @property
+    def plan_key(self):
+        # 字段组合相同的序列化器共用关联加载的分析结果与快速序列化的编译结果
+        requested, expand = self.get_requested_fields()
+        return type(self), requested, expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.get_requested_fields()
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        for name in sorted(expand):
+            fields[name] = copy.deepcopy(expandable[name])
+        if requested is not None:
+            for name in list(fields):
+                # 只参与反序列化的字段不会输出  保留
+                if name not in requested and name not in expand and not fields[name].write_only:
+                    del fields[name]
+        return fields
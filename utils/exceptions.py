@@ -1,21 +1,59 @@
 # 自定义异常处理
+import logging
+
 from rest_framework.response import Response
 from rest_framework.views import exception_handler as drf_exception_handler
 from rest_framework import status
+
+from utils.response import APIResponse
+from utils.timing import current_timer
+
+# 日志由 settings.LOGGING 中的 AsyncHandler 在后台线程写入  不阻塞请求
+logger = logging.getLogger(__name__)
+
+
+class InvalidQuery(Exception):
+    """
+    服务端拒绝的查询参数(过滤、排序、分页游标)  由 exception_handler 返回 400
+    不是 drf 的异常  其他 drf 的异常仍然与原来一样重新抛出
+    """
+
+    def __init__(self, param, message):
+        super().__init__("%s: %s" % (param, message))
+        self.param = param
+        self.message = message
+
+
 def exception_handler(exc,context):
-    # print(exc,'01010101',context)
+    request = context['request']
+    # 详细错误信息的定义  作为日志的上下文
+    extra = {
+        'view': type(context['view']).__name__,
+        'method': request.method,
+        'path': request.path,
+        'exc_type': type(exc).__name__,
+    }
+    timer = current_timer()
+    if timer is not None:
+        extra['duration_ms'] = round(timer.elapsed() * 1000, 2)
+        extra['queries'] = timer.queries
 
-    # 详细错误信息的定义
-    error="%s %s %s"%(context['view'],context['request'].method,exc)
-    print(error)
+    if isinstance(exc, InvalidQuery):
+        extra['status'] = status.HTTP_400_BAD_REQUEST
+        logger.info('查询参数无效: %s', exc, extra=extra)
+        return APIResponse(status.HTTP_400_BAD_REQUEST, exc.message, http_status=status.HTTP_400_BAD_REQUEST)
 
     # 先让drf处理，drf无法处理(返回值为None)再由自定义异常处理
     response=drf_exception_handler(exc,context)
     if response is None:
+        extra['status'] = status.HTTP_500_INTERNAL_SERVER_ERROR
+        logger.error('未处理的异常: %s', exc, exc_info=(type(exc), exc, exc.__traceback__), extra=extra)
         return Response(
             {'error_msg':'程序失误了，请稍等一会'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,exception=None
         )
-        # return  Response({'error_msg':error})  #error替换掉原来的内容
-    # 异常信息不为空，说明异常已被drf处理
-    return None
\ No newline at end of file
+    # 异常信息不为空，说明异常已被drf处理  与原来一样返回 None  由 drf 重新抛出(500)
+    # 请求以 500 结束  按错误记录  调用栈由 django.request 的日志记录
+    extra['status'] = status.HTTP_500_INTERNAL_SERVER_ERROR
+    logger.error('请求异常: %s', exc, extra=extra)
+    return None
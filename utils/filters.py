@@ -0,0 +1,217 @@
+"""
+只允许使用有索引的字段进行过滤与排序
+
+视图中声明:
+    filter_backends = (IndexedFilterBackend, IndexedOrderingFilter)
+    # 查询参数 -> 字段__查询方式  in 的参数使用逗号分隔
+    filter_fields = {"price_min": "price__gte", "publish": "publish__in"}
+    # ?ordering=price / ?ordering=-create_time  只允许一个排序字段  主键作为第二排序字段
+    ordering_fields = ("create_time", "price")
+
+声明的字段必须是索引的第一列  否则抛出 ImproperlyConfigured
+所有的查询都会过滤 is_delete  以 is_delete 开头的组合索引从第二列开始计算
+请求中使用了没有声明的排序字段时抛出 InvalidQuery  由 utils.exceptions.exception_handler 返回 400
+
+排序(包括分页默认的排序)还要与过滤条件匹配  数据库才能直接按索引的顺序读取  不需要临时的 B-tree 排序
+    需要一个索引  排序字段之前的列都有单个值的等值条件(status=true、publish=1)
+    其他过滤条件(范围、多个值的 in)只能作用在排序字段上  否则数据库可能选择过滤字段的索引再排序
+    多对多的过滤是子查询  不影响排序
+不满足时返回 400  例如 ?price_min=10&ordering=-create_time
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError as DjangoValidationError
+from django.utils import timezone
+from rest_framework.filters import BaseFilterBackend
+
+from utils.exceptions import InvalidQuery
+
+# 组合索引中作为等值条件的前缀列
+INDEX_PREFIX = ("is_delete",)
+
+# 按模型缓存有索引的字段与索引的列
+_indexed = {}
+_index_columns = {}
+
+
+def indexed_fields(model):
+    """
+    return: 可以通过索引过滤与排序的字段名
+    """
+    if model not in _indexed:
+        fields = {model._meta.pk.name}
+        for field in model._meta.get_fields():
+            if field.many_to_many and not field.auto_created:
+                # 自动创建的关系表中两个外键都有索引
+                fields.add(field.name)
+            elif getattr(field, "concrete", False) and (field.db_index or field.unique):
+                fields.add(field.name)
+        for index in model._meta.indexes:
+            names = [name.lstrip("-") for name in index.fields]
+            while names and names[0] in INDEX_PREFIX:
+                names.pop(0)
+            if names:
+                fields.add(names[0])
+        _indexed[model] = fields
+    return _indexed[model]
+
+
+def index_columns(model):
+    """
+    return: 每个索引去掉前缀列与末尾主键后的列  [(列, ...), ...]
+    """
+    if model not in _index_columns:
+        pk = model._meta.pk.name
+        prefix = [name for name in INDEX_PREFIX if any(field.name == name for field in model._meta.concrete_fields)]
+        columns = []
+        for index in model._meta.indexes:
+            names = [name.lstrip("-") for name in index.fields]
+            if names[:len(prefix)] != prefix:
+                continue
+            names = names[len(prefix):]
+            if names and names[-1] == pk:
+                names.pop()
+            columns.append(tuple(names))
+        if not prefix:
+            # 没有前缀列时可以按主键的顺序扫描整张表
+            columns.append(())
+        _index_columns[model] = columns
+    return _index_columns[model]
+
+
+def is_sortable(model, equal, filtered, field):
+    """
+    过滤之后按 field(与主键)排序时  能否直接按某个索引的顺序读取
+    equal: 单个值等值条件的列  filtered: 所有过滤的列
+    """
+    pk = model._meta.pk.name
+    for columns in index_columns(model):
+        if field == pk:
+            # 索引的列全部被等值条件绑定  剩下的顺序就是主键的顺序
+            bound = set(columns)
+        elif field in columns:
+            bound = set(columns[:columns.index(field)])
+        else:
+            continue
+        if bound <= equal and filtered <= bound | {field}:
+            return True
+    return False
+
+
+def check_indexed(model, names, view):
+    unindexed = set(names) - indexed_fields(model)
+    if unindexed:
+        raise ImproperlyConfigured("%s 中的字段 %s 没有索引" % (type(view).__name__, ", ".join(sorted(unindexed))))
+
+
+class IndexedFilterBackend(BaseFilterBackend):
+
+    def get_filter_fields(self, view, model):
+        # 视图可以按模型提供不同的过滤字段  view.get_filter_fields(model)
+        if hasattr(view, "get_filter_fields"):
+            filter_fields = view.get_filter_fields(model)
+        else:
+            filter_fields = getattr(view, "filter_fields", {})
+        check_indexed(model, {lookup.split("__")[0] for lookup in filter_fields.values()}, view)
+        return filter_fields
+
+    def to_python(self, field, param, value):
+        if field.get_internal_type() == "BooleanField":
+            # 兼容 true / false
+            value = {"true": "True", "false": "False"}.get(value.lower(), value)
+        try:
+            value = field.to_python(value)
+        except DjangoValidationError:
+            raise InvalidQuery(param, "无效的值: %s" % value)
+        if value is None:
+            raise InvalidQuery(param, "无效的值")
+        if settings.USE_TZ and hasattr(value, "tzinfo") and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    def get_conditions(self, request, view, model):
+        """
+        return: (单个值等值条件的列, 所有过滤的列)  不包括多对多
+        """
+        equal, filtered = set(), set()
+        for param, lookup in self.get_filter_fields(view, model).items():
+            raw = request.query_params.get(param)
+            if raw is None or raw == "":
+                continue
+            name, _, operator = lookup.partition("__")
+            if model._meta.get_field(name).many_to_many:
+                continue
+            filtered.add(name)
+            if operator in ("", "exact") or (operator == "in" and "," not in raw):
+                equal.add(name)
+        return equal, filtered
+
+    def filter_queryset(self, request, queryset, view):
+        model = queryset.model
+        for param, lookup in self.get_filter_fields(view, model).items():
+            raw = request.query_params.get(param)
+            if raw is None or raw == "":
+                continue
+            name, _, operator = lookup.partition("__")
+            field = model._meta.get_field(name)
+
+            if field.many_to_many:
+                # 通过关系表的索引查出主键  不使用 JOIN + DISTINCT
+                target = field.related_model._meta.pk
+                values = [self.to_python(target, param, value) for value in raw.split(",")]
+                through = field.remote_field.through
+                ids = through.objects.filter(**{"%s__in" % field.m2m_reverse_field_name(): values})
+                queryset = queryset.filter(pk__in=ids.values(field.m2m_field_name()))
+                continue
+
+            # 外键使用关联模型主键的类型
+            target = field.target_field if field.is_relation else field
+            if operator == "in":
+                value = [self.to_python(target, param, value) for value in raw.split(",")]
+            else:
+                value = self.to_python(target, param, raw)
+            if operator in ("", "exact") and field.get_internal_type() == "BooleanField":
+                # Django 3.x 中布尔字段的等值条件生成 WHERE "status"  不能使用组合索引  改为 IN
+                lookup, value = "%s__in" % name, [value]
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+
+class IndexedOrderingFilter(BaseFilterBackend):
+    ordering_param = "ordering"
+
+    def get_ordering(self, request, queryset, view, default=None):
+        """
+        default: 没有传递排序参数时使用的排序(分页的默认排序)
+        return: (排序字段, 主键) 方向相同  没有排序时返回 None
+        """
+        value = request.query_params.get(self.ordering_param)
+        model = queryset.model
+        if not value:
+            ordering = default
+        else:
+            ordering_fields = getattr(view, "ordering_fields", ())
+            check_indexed(model, ordering_fields, view)
+
+            name = value.strip()
+            field = name.lstrip("-")
+            if "," in name or field not in ordering_fields:
+                raise InvalidQuery(self.ordering_param, "只支持按 %s 中的一个字段排序" % ", ".join(ordering_fields))
+            direction = "-" if name.startswith("-") else ""
+            pk = model._meta.pk.name
+            ordering = (name,) if field == pk else (name, direction + pk)
+
+        if ordering:
+            self.check_sortable(request, model, view, ordering[0].lstrip("-"))
+        return ordering
+
+    def check_sortable(self, request, model, view, field):
+        equal, filtered = IndexedFilterBackend().get_conditions(request, view, model)
+        if not is_sortable(model, equal, filtered, field):
+            raise InvalidQuery(self.ordering_param, "按 %s 过滤时没有可以按 %s 排序的索引" % (
+                ", ".join(sorted(filtered)), field))
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if ordering:
+            return queryset.order_by(*ordering)
+        return queryset
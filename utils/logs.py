@@ -0,0 +1,127 @@
+"""
+不阻塞请求的结构化日志
+
+AsyncHandler  请求线程只把日志放入队列  由后台线程格式化并写入  队列已满时丢弃并计数
+DedupeFilter  相同的错误在 window 秒内只记录前 burst 条  之后的第一条日志带上被丢弃的次数 repeated
+JsonFormatter 每条日志输出一行 JSON  包含 view / method / path / duration_ms 等上下文
+"""
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# 附加在日志上的上下文字段
+CONTEXT_FIELDS = ("view", "method", "path", "status", "exc_type", "duration_ms", "queries", "repeated")
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DedupeFilter(logging.Filter):
+
+    # 记录的错误种类超过这个数量后清理过期的
+    MAX_KEYS = 1000
+
+    def __init__(self, window=60, burst=5):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.lock = threading.Lock()
+        # {key: [窗口开始的时间, 窗口内的次数, 丢弃的次数]}
+        self.seen = {}
+
+    def get_key(self, record):
+        return record.name, record.levelno, getattr(record, "view", None), getattr(record, "exc_type", None), record.msg
+
+    def filter(self, record):
+        key = self.get_key(record)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is not None and entry[2]:
+                    record.repeated = entry[2]
+                if len(self.seen) >= self.MAX_KEYS:
+                    self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+                self.seen[key] = [now, 1, 0]
+                return True
+            entry[1] += 1
+            if entry[1] <= self.burst:
+                return True
+            entry[2] += 1
+            return False
+
+
+class AsyncHandler(QueueHandler):
+    """
+    filename 为空时写入标准错误
+    后台线程在进程第一次写日志时启动  fork 出的子进程(gunicorn --preload)中没有父进程的线程  重新创建队列并启动
+    """
+
+    def __init__(self, filename=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.FileHandler(filename, encoding="utf-8") if filename else logging.StreamHandler()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        # 启动后台线程的进程
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+    def setFormatter(self, fmt):
+        # 格式化在后台线程中进行
+        self.target.setFormatter(fmt)
+
+    def start(self):
+        with self._start_lock:
+            if self._pid == os.getpid() or self._stopped:
+                return
+            # 父进程的队列可能在 fork 时处于加锁的状态  子进程使用新的队列
+            if self._pid is not None:
+                self.queue = queue.Queue(self.maxsize)
+            self.listener = QueueListener(self.queue, self.target)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # 只合并消息的参数  异常堆栈等留给后台线程格式化
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # 退出时写完队列中剩余的日志  只停止本进程启动的线程
+        if not self._stopped:
+            self._stopped = True
+            if self._pid == os.getpid():
+                self.listener.stop()
+            self.target.close()
+        super().close()
@@ -0,0 +1,150 @@
+"""
+媒体文件的访问
+
+代替 django.views.static.serve:
+    支持 Range 请求(单个范围)与 If-None-Match / If-Modified-Since / If-Range(ETag 或时间)
+    上传目录(MEDIA_HASHED_PREFIXES)中按内容命名的原图设置永久缓存  其他文件使用 MEDIA_CACHE_MAX_AGE
+        缩略图的文件名也包含原图的哈希  但修改 IMAGE_RENDITIONS 后内容会变化  不能永久缓存
+    配置 MEDIA_SENDFILE 后由前端的 web 服务器发送文件  不占用应用的进程
+        "x-sendfile": Apache / lighttpd  响应头中返回文件的绝对路径
+        "x-accel-redirect": nginx  返回 MEDIA_ACCEL_PREFIX + 文件的相对路径
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from utils.storage import is_hashed_name
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def _cache_control(path):
+    prefixes = tuple(getattr(settings, "MEDIA_HASHED_PREFIXES", ("img/",)))
+    if path.startswith(prefixes) and is_hashed_name(path):
+        # 文件名由内容决定  内容不会变化
+        return "public, max-age=31536000, immutable"
+    return "public, max-age=%s" % getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600)
+
+
+def _parse_range(header, size):
+    """
+    return: (开始, 结束)  不支持的格式返回 None(返回完整文件)  范围无效时返回 False
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if size == 0:
+        # 空文件没有可以返回的范围
+        return False
+    if not start:
+        # bytes=-500  最后500个字节
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(value, etag, last_modified):
+    """
+    If-Range 可以是 ETag 或者 HTTP 时间  与当前的文件一致时才返回范围  否则返回完整的文件
+    """
+    if value is None:
+        return True
+    value = value.strip()
+    if value.startswith(('"', "W/")):
+        # 弱 ETag 不能用于 Range
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _iter_range(fullpath, start, end):
+    with open(fullpath, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path, document_root=None):
+    document_root = document_root or settings.MEDIA_ROOT
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(document_root, path)
+    except Exception:
+        raise Http404("文件不存在")
+    if not os.path.isfile(fullpath):
+        raise Http404("文件不存在")
+
+    stat = os.stat(fullpath)
+    size = stat.st_size
+    etag = quote_etag("%x-%x" % (int(stat.st_mtime), size))
+    last_modified = int(stat.st_mtime)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": _cache_control(path),
+        "Accept-Ranges": "bytes",
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or "application/octet-stream"
+
+    sendfile = getattr(settings, "MEDIA_SENDFILE", None)
+    if sendfile:
+        # 由 web 服务器发送文件  Range 也由 web 服务器处理
+        response = HttpResponse(content_type=content_type)
+        if sendfile == "x-accel-redirect":
+            response["X-Accel-Redirect"] = getattr(settings, "MEDIA_ACCEL_PREFIX", "/protected-media/") + path
+        else:
+            response["X-Sendfile"] = fullpath
+    else:
+        byte_range = None
+        range_header = request.META.get("HTTP_RANGE")
+        if range_header and _if_range_matches(request.META.get("HTTP_IF_RANGE"), etag, last_modified):
+            byte_range = _parse_range(range_header, size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%s" % size
+            return response
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(_iter_range(fullpath, start, end), status=206,
+                                             content_type=content_type)
+            response["Content-Range"] = "bytes %s-%s/%s" % (start, end, size)
+            response["Content-Length"] = end - start + 1
+        else:
+            response = FileResponse(open(fullpath, "rb"), content_type=content_type)
+            response["Content-Length"] = size
+
+    if encoding:
+        response["Content-Encoding"] = encoding
+    for key, value in headers.items():
+        response[key] = value
+    return response
@@ -0,0 +1,115 @@
+"""
+游标(keyset)分页
+
+默认按照 (create_time, id) 排序  通过上一页最后一条数据的排序值定位下一页
+视图通过 ?ordering= 指定排序时按 (排序字段, id) 排序
+不使用 OFFSET 也不执行 COUNT(*)  游标条件按索引查找  无论翻到第几页查询的代价都是一样的
+无效的游标返回 400
+"""
+import base64
+import json
+from functools import reduce
+
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
+
+from utils.exceptions import InvalidQuery
+from utils.response import APIResponse
+
+
+class BookCursorPagination(BasePagination):
+    # 前端通过携带 cursor 或 page_size 参数开启分页  不携带时返回全部数据
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 20
+    max_page_size = 100
+    # 所有排序字段的方向必须一致  最后一个字段需要唯一
+    ordering = ("-create_time", "-id")
+    invalid_cursor_message = "无效的分页游标"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [name.lstrip("-") for name in self.ordering]
+        self.descending = self.ordering[0].startswith("-")
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        # 多查一条用来判断是否还有下一页
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        # 视图的排序过滤器(utils.filters.IndexedOrderingFilter)决定排序  并检查默认的排序能否使用索引
+        for backend in getattr(view, "filter_backends", ()):
+            if hasattr(backend, "get_ordering"):
+                return backend().get_ordering(request, queryset, view, default=self.ordering)
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position_filter(self, position):
+        """
+        排在游标之后的数据  按字段展开为 OR 条件(不是 SQL 的行值比较)
+            a < x or (a = x and b < y)
+        最后一个字段(id)唯一  排序值相同的数据也不会重复或遗漏
+        再加上第一个字段的范围 a <= x  OR 条件无法用于索引查找
+            没有这个范围时数据库从索引的开头扫描  越往后翻页越慢
+        """
+        lookup = "lt" if self.descending else "gt"
+        conditions = []
+        for index, name in enumerate(self.fields):
+            condition = {field: position[i] for i, field in enumerate(self.fields[:index])}
+            condition["%s__%s" % (name, lookup)] = position[index]
+            conditions.append(Q(**condition))
+        bound = Q(**{"%s__%se" % (self.fields[0], lookup): position[0]})
+        return bound & reduce(lambda a, b: a | b, conditions)
+
+    def encode_cursor(self, obj):
+        position = []
+        for name in self.fields:
+            value = getattr(obj, name)
+            # 时间使用 isoformat  保留时区与微秒
+            position.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(position) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value)
+                    for name, value in zip(self.fields, position)]
+        except Exception:
+            raise InvalidQuery(self.cursor_query_param, self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return APIResponse(results=data, next=self.get_next_link())
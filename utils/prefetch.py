@@ -0,0 +1,128 @@
+"""
+根据序列化器的字段树自动为查询集添加 select_related / prefetch_related
+
+序列化器中的嵌套序列化器、带 "." 的 source 以及模型上的自定义属性
+都会在序列化时逐行触发关联查询(N+1)  这里在查询之前先分析序列化器
+将这些关联一次性的加载出来
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+# 按序列化器类(或 plan_key)缓存分析结果  字段树在类定义后不会变化
+_plan_cache = {}
+
+
+def _relation_path(model, attrs):
+    """
+    沿着 source_attrs 在模型上查找最长的关联路径
+    return: (关联路径列表, 是否需要 prefetch_related, 路径末端的模型)
+    """
+    path = []
+    need_prefetch = False
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        path.append(attr)
+        # 多对多与一对多只能通过 prefetch_related 加载
+        if field.many_to_many or field.one_to_many:
+            need_prefetch = True
+        model = field.related_model
+    return path, need_prefetch, model
+
+
+def _collect(serializer, model, prefix, prefetching, select, prefetch):
+    """
+    递归分析序列化器的字段
+    prefix: 外层嵌套序列化器的关联路径
+    prefetching: 外层路径中已经出现了多对多/一对多  之后的关联都只能 prefetch
+    """
+
+    def add(relation, need_prefetch):
+        path = "__".join(prefix + relation)
+        if prefetching or need_prefetch:
+            prefetch.add(path)
+        else:
+            select.add(path)
+
+    for field in serializer.fields.values():
+        # 只参与反序列化的字段不会在输出时访问关联对象
+        if field.write_only or field.source == "*":
+            continue
+
+        attrs = field.source_attrs
+        relation, need_prefetch, related_model = _relation_path(model, attrs)
+
+        if not relation:
+            # 模型上的自定义属性  由模型的 related_hints 声明它依赖哪些关联
+            for hint in getattr(model, "related_hints", {}).get(attrs[0], ()):
+                hint_relation, hint_prefetch, _ = _relation_path(model, hint.split("__"))
+                if hint_relation:
+                    add(hint_relation, hint_prefetch)
+            continue
+
+        child = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(child, serializers.BaseSerializer):
+            # 嵌套的序列化器  加载关联本身后继续分析嵌套序列化器的字段
+            add(relation, need_prefetch)
+            _collect(child, related_model, prefix + relation,
+                     prefetching or need_prefetch, select, prefetch)
+        elif isinstance(field, PrimaryKeyRelatedField) and len(attrs) == 1:
+            # 外键的主键字段直接读取 publish_id 列  不会产生查询
+            continue
+        else:
+            # 多对多主键列表、其他关联字段以及 "publish.press_name" 形式的 source
+            add(relation, need_prefetch)
+
+
+def get_eager_loading_plan(serializer):
+    """
+    分析序列化器(类或实例)  返回需要 select_related 与 prefetch_related 的路径
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    # 按查询参数裁剪字段的序列化器实例  使用字段组合作为缓存的键
+    cache_key = serializer if isinstance(serializer, type) else getattr(serializer, "plan_key", None)
+    if cache_key in _plan_cache:
+        return _plan_cache[cache_key]
+
+    if isinstance(serializer, type):
+        serializer = serializer()
+
+    select, prefetch = set(), set()
+    _collect(serializer, serializer.Meta.model, [], False, select, prefetch)
+    # 已被更长路径包含的 select_related 路径不需要重复声明
+    select = {path for path in select if not any(other.startswith(path + "__") for other in select)}
+    plan = (sorted(select), sorted(prefetch))
+
+    if cache_key is not None:
+        _plan_cache[cache_key] = plan
+    return plan
+
+
+def setup_eager_loading(queryset, serializer):
+    """
+    为查询集添加序列化器所需要的关联加载  使查询次数与数据条数无关
+    """
+    select, prefetch = get_eager_loading_plan(serializer)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class EagerLoadingMixin(object):
+    """
+    为 GenericAPIView 及其子类提供自动的关联加载
+    需要放在继承列表中 GenericAPIView 的前面
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # 使用带有 request 的序列化器实例  只加载 ?fields= / ?expand= 需要的关联
+        return setup_eager_loading(queryset, self.get_serializer())
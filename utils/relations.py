@@ -0,0 +1,87 @@
+"""
+反序列化多条数据时批量校验关联字段
+
+默认的 PrimaryKeyRelatedField 每校验一个主键就执行一次查询
+列表序列化器在校验之前先收集所有数据中的主键  每个关联模型只查询一次
+子序列化器的字段直接从查询结果中取出对象
+"""
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
+class BatchedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    可以使用预先批量加载结果的主键字段
+    没有预加载时与 PrimaryKeyRelatedField 完全一致
+    """
+    preloaded = None
+
+    def to_internal_value(self, data):
+        if self.preloaded is None:
+            return super().to_internal_value(data)
+
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            pk = to_pk(self, data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        obj = self.preloaded.get(pk)
+        if obj is None:
+            self.fail("does_not_exist", pk_value=data)
+        return obj
+
+
+def to_pk(field, value):
+    """将前台传递的值转换为与 in_bulk 结果的键相同的类型"""
+    return field.get_queryset().model._meta.pk.to_python(value)
+
+
+def _batched_fields(serializer):
+    """返回 (字段名, 是否多对多, 主键字段) 的列表"""
+    fields = []
+    for name, field in serializer.fields.items():
+        if field.read_only:
+            continue
+        many = isinstance(field, ManyRelatedField)
+        relation = field.child_relation if many else field
+        if isinstance(relation, BatchedPrimaryKeyRelatedField):
+            fields.append((name, many, relation))
+    return fields
+
+
+@contextmanager
+def preload_related(serializer, data):
+    """
+    收集列表数据中所有的关联主键  每个关联字段执行一次 in_bulk 查询
+    在 with 语句块中子序列化器的关联字段直接使用查询结果
+    """
+    fields = _batched_fields(serializer)
+    if not isinstance(data, list) or not fields:
+        yield
+        return
+
+    for name, many, relation in fields:
+        pks = set()
+        for item in data:
+            if not isinstance(item, Mapping) or item.get(name) is None:
+                continue
+            values = item[name] if many else [item[name]]
+            if many and not isinstance(values, (list, tuple)):
+                continue
+            for value in values:
+                try:
+                    pks.add(to_pk(relation, value))
+                except (TypeError, ValueError, DjangoValidationError):
+                    # 类型错误的值交给字段自己报错
+                    continue
+        relation.preloaded = relation.get_queryset().in_bulk(list(pks))
+
+    try:
+        yield
+    finally:
+        for name, many, relation in fields:
+            relation.preloaded = None
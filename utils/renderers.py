@@ -0,0 +1,68 @@
+"""
+JSON 以外的响应格式  通过 Accept 请求头(或 ?format=)选择
+
+    Accept: application/vnd.columnar+json   ?format=columnar
+        列表中的每个字典只输出一次键名  {"columns": [...], "rows": [[...], ...]}
+    Accept: application/msgpack             ?format=msgpack
+        MessagePack 二进制格式  需要安装 msgpack  没有安装时 settings 中不启用
+
+只转换列表以及 APIResponse 中的 results  其他数据与 JSON 的结构相同
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils.timing import TimedRendererMixin, measure
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def to_columns(rows):
+    """
+    [{"a": 1, "b": 2}, {"a": 3, "b": 4}] -> {"columns": ["a", "b"], "rows": [[1, 2], [3, 4]]}
+    每一行的键不同时取并集  缺少的值为 None
+    """
+    columns = list(OrderedDict.fromkeys(key for row in rows for key in row))
+    return OrderedDict((
+        ("columns", columns),
+        ("rows", [[row.get(column) for column in columns] for row in rows]),
+    ))
+
+
+def columnar(data):
+    if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+        return to_columns(data)
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        data = OrderedDict(data)
+        data["results"] = columnar(data["results"])
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = "application/vnd.columnar+json"
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # 转换的耗时也计入渲染
+        with measure("render"):
+            return super().render(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(TimedRendererMixin, BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise ImproperlyConfigured("MessagePackRenderer 需要安装 msgpack")
+        if data is None:
+            return b""
+        # Decimal、时间、QuerySet 等与 JSON 的转换方式相同
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
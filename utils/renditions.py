@@ -0,0 +1,151 @@
+"""
+图片的预生成缩略图
+
+上传图片后在后台线程池中生成多个尺寸的 JPEG 版本  列表接口返回缩略图的地址
+缩略图还没有生成完成时返回原图的地址
+尺寸通过 settings.IMAGE_RENDITIONS 配置  {名称: (最大宽度, 最大高度)}
+缩略图是否存在的检查结果缓存在进程内(数量有上限)  不存在的结果 RENDITION_MISSING_TIMEOUT 秒后重新检查
+    默认图片等永远不会生成缩略图的图片  不会每次请求都访问文件系统
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from rest_framework import serializers
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDITIONS = {
+    "thumbnail": (150, 150),
+    "card": (480, 480),
+    "full": (1280, 1280),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+# 缩略图是否存在  生成与删除时直接更新
+_ready = LRUCache(max_size=getattr(settings, "RENDITION_CACHE_SIZE", 10000),
+                  timeout=getattr(settings, "RENDITION_READY_TIMEOUT", 86400))
+_missing = LRUCache(max_size=getattr(settings, "RENDITION_CACHE_SIZE", 10000),
+                    timeout=getattr(settings, "RENDITION_MISSING_TIMEOUT", 60))
+
+
+def get_renditions():
+    return getattr(settings, "IMAGE_RENDITIONS", DEFAULT_RENDITIONS)
+
+
+def rendition_name(name, rendition):
+    """img/dt.png -> renditions/thumbnail/img/dt.png.jpg  保留原来的扩展名  同名不同格式的图片不会冲突"""
+    return "renditions/%s/%s.jpg" % (rendition, name)
+
+
+def _mark(name, ready):
+    (_ready if ready else _missing).set(name, True)
+    (_missing if ready else _ready).delete(name)
+
+
+def is_ready(storage, name):
+    if _ready.get(name):
+        return True
+    if _missing.get(name):
+        return False
+    ready = storage.exists(name)
+    _mark(name, ready)
+    return ready
+
+
+def generate_renditions(storage, name):
+    """
+    生成一张图片的所有尺寸  已存在的会被覆盖
+    """
+    from PIL import Image
+
+    with storage.open(name, "rb") as f:
+        original = Image.open(f)
+        original.load()
+    if original.mode not in ("RGB", "L"):
+        original = original.convert("RGB")
+
+    for rendition, size in get_renditions().items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", quality=80, optimize=True, progressive=True)
+
+        target = rendition_name(name, rendition)
+        _mark(target, False)
+        if storage.exists(target):
+            storage.delete(target)
+        # 按内容寻址的存储会重新命名文件  缩略图需要保存在固定的位置
+        getattr(storage, "save_exact", storage.save)(target, ContentFile(buffer.getvalue()))
+        _mark(target, True)
+
+
+def delete_renditions(storage, name):
+    for rendition in get_renditions():
+        target = rendition_name(name, rendition)
+        _mark(target, False)
+        storage.delete(target)
+
+
+def _generate(storage, name):
+    try:
+        generate_renditions(storage, name)
+    except Exception:
+        logger.exception("生成缩略图失败: %s", name)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, "RENDITION_WORKERS", 2),
+                                           thread_name_prefix="renditions")
+    return _executor
+
+
+def schedule_renditions(field_file):
+    """
+    把图片交给后台线程池生成缩略图  所有尺寸都已存在时不做任何操作
+    """
+    if not field_file or not field_file.name:
+        return None
+    storage, name = field_file.storage, field_file.name
+    if all(is_ready(storage, rendition_name(name, rendition)) for rendition in get_renditions()):
+        return None
+    if not storage.exists(name):
+        return None
+    return get_executor().submit(_generate, storage, name)
+
+
+def rendition_urls(storage, name, request=None):
+    """
+    {尺寸名称: 地址}  没有生成完成的尺寸使用原图的地址
+    """
+    if not name:
+        return None
+    urls = {}
+    for rendition in get_renditions():
+        target = rendition_name(name, rendition)
+        url = storage.url(target if is_ready(storage, target) else name)
+        urls[rendition] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+class RenditionField(serializers.Field):
+    """
+    只读字段  输出图片各个尺寸的地址
+    pic_renditions = RenditionField(source="pic")
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return rendition_urls(value.storage, value.name, self.context.get("request"))
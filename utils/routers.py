@@ -0,0 +1,86 @@
+"""
+读写分离的数据库路由
+
+GET 等安全的请求读取从库(settings.DATABASE_REPLICAS)  写入以及其他请求使用主库
+客户端写入数据后的 REPLICA_PIN_SECONDS 秒内  它的请求都读取主库  保证能读到自己刚写入的数据
+    是否写入了数据由 utils.writes 判断  出错时返回 200 的请求不会固定到主库
+"""
+import asyncio
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from utils.writes import track_writes
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "db_pin_primary"
+
+# 当前请求是否可以读取从库  使用 ContextVar 在线程与协程中都可以正确隔离
+_read_replica = ContextVar("read_replica", default=False)
+
+
+def get_replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and _read_replica.get():
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 主库与从库的数据相同
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 从库的数据由主库复制  不执行迁移
+        return db not in get_replicas()
+
+
+class ReplicaRoutingMiddleware(object):
+    # 同时支持同步与异步  ContextVar 会复制到 sync_to_async 的线程中
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # 与 MiddlewareMixin 一样标记为协程函数
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            with track_writes() as writes:
+                response = self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+        return self.process(response, writes)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            with track_writes() as writes:
+                response = await self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+        return self.process(response, writes)
+
+    def start(self, request):
+        pinned = PIN_COOKIE in request.COOKIES
+        return _read_replica.set(request.method in SAFE_METHODS and not pinned)
+
+    def process(self, response, writes):
+        if writes:
+            # 写入后的一段时间内读取主库
+            response.set_cookie(PIN_COOKIE, "1", max_age=getattr(settings, "REPLICA_PIN_SECONDS", 5),
+                                httponly=True)
+        return response
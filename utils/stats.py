@@ -0,0 +1,22 @@
+"""
+基准测试命令共用的工具  延迟的分位数与报告中记录的代码版本
+"""
+import subprocess
+
+from django.conf import settings
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(int(round(percent / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,102 @@
+"""
+按内容寻址的文件存储
+
+上传的文件按照内容的 sha256 命名  img/ab/ab12...ef.jpg
+相同内容的文件只保存一份  重复上传时直接返回已存在的文件名
+文件名由内容决定  内容不会变化  可以永久缓存
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# 由内容哈希生成的文件名
+HASHED_NAME_RE = re.compile(r"(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.[\w]+)?$")
+
+
+# 复用已有文件与删除文件之间互斥  只在同一个进程内有效
+_lock = threading.Lock()
+
+
+def is_hashed_name(name):
+    return bool(name and HASHED_NAME_RE.search(name))
+
+
+def default_names(*models):
+    """
+    图片字段的默认值(img/1.jpeg)  所有没有上传图片的数据共用  不能删除或迁移
+    """
+    names = set()
+    for model in models:
+        field = model._meta.get_field("pic")
+        if field.has_default():
+            names.add(field.get_default())
+    return names
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+
+    def hashed_name(self, name, content):
+        hasher = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        digest = hasher.hexdigest()
+        dirname, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        return os.path.join(dirname, digest[:2], digest + ext).replace("\\", "/")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            from django.core.files import File
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        with _lock:
+            # 已经存在相同内容的文件  直接复用  更新修改时间  见 release
+            if self.exists(name):
+                os.utime(self.path(name))
+                return name
+            return super().save(name, content, max_length=max_length)
+
+    def save_exact(self, name, content, max_length=None):
+        # 按指定的文件名保存(缩略图等由原图派生的文件)
+        return super().save(name, content, max_length=max_length)
+
+
+media_storage = HashedFileSystemStorage()
+
+
+def release(name, *models):
+    """
+    引用计数：没有任何数据引用这个文件后删除文件以及它的缩略图
+    只处理按内容命名的文件  默认图片等其他文件不会被删除
+    在事务提交后调用  加锁后重新检查引用
+    最近 MEDIA_RELEASE_GRACE 秒内保存或复用过的文件不删除
+        引用它的数据可能还没有提交  其他进程的上传也通过文件的修改时间判断
+    """
+    if not is_hashed_name(name) or name in default_names(*models):
+        return False
+    from utils.renditions import delete_renditions
+    with _lock:
+        for model in models:
+            if model.objects.filter(pic=name).exists():
+                return False
+        try:
+            if time.time() - os.path.getmtime(media_storage.path(name)) < settings.MEDIA_RELEASE_GRACE:
+                return False
+        except FileNotFoundError:
+            pass
+        media_storage.delete(name)
+        delete_renditions(media_storage, name)
+    return True
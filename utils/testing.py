@@ -0,0 +1,49 @@
+"""
+测试中共用的工具
+
+测试客户端在请求开始时会清空 connection.queries(CaptureQueriesContext 统计不到)
+通过 execute_wrapper 记录执行的 SQL  与 TimingMiddleware 一样不记录保存点语句
+"""
+from contextlib import contextmanager
+
+from django.db import connections
+
+from utils.cache import get_response_cache
+from utils.timing import is_savepoint
+
+
+class QueryCountMixin(object):
+    """
+    与 TestCase 一起使用
+        with self.record_queries() as queries:
+            ...
+        self.count_queries("/api/books/")
+    """
+
+    @contextmanager
+    def record_queries(self, using="default"):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if not is_savepoint(sql):
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connections[using].execute_wrapper(record):
+            yield queries
+
+    def get_with_queries(self, url, **extra):
+        """
+        清空响应缓存后请求  流式响应会读取完内容
+        return: (response, 执行的 SQL)
+        """
+        get_response_cache().invalidate()
+        with self.record_queries() as queries:
+            response = self.client.get(url, **extra)
+            if response.streaming:
+                response.streamed = b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def count_queries(self, url, **extra):
+        return len(self.get_with_queries(url, **extra)[1])
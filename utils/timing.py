@@ -0,0 +1,293 @@
+"""
+请求的耗时统计
+
+TimingMiddleware 记录每个请求的查询次数、SQL 耗时、序列化耗时与渲染耗时
+    通过 Server-Timing 响应头返回  浏览器的开发者工具中可以直接查看
+    按路由汇总在进程内  /metrics/ 以 Prometheus 文本格式输出
+    查询次数超过 settings.QUERY_BUDGETS 中的预算时记录警告  {路由: 次数}  "*" 为默认的预算
+
+序列化耗时由 TimedSerializerMixin 与 ValuesSerializer 记录  渲染耗时由 TimedRendererMixin 记录
+嵌套的序列化器只记录最外层的耗时  流式响应在返回之后执行的查询不会被统计
+SQL 耗时通过 execute_wrapper 统计  只包含执行语句的时间  不包含读取结果的时间
+    数据库连接创建时安装  按 ContextVar 找到当前请求的计时器  异步视图在线程池中执行的查询同样会被统计
+嵌套的 atomic 产生的保存点语句只计入耗时  不计入查询次数  与最外层的事务(不经过 cursor)一致
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的计时器
+_current = ContextVar("request_timer", default=None)
+
+# 请求总耗时的直方图区间(秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+SAVEPOINT_RE = re.compile(r"^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b", re.I)
+
+
+def is_savepoint(sql):
+    return bool(SAVEPOINT_RE.match(sql))
+
+
+class RequestTimer(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.durations = {"sql": 0.0, "serialize": 0.0, "render": 0.0}
+        self.depth = {"serialize": 0, "render": 0}
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not is_savepoint(sql):
+                self.queries += 1
+            self.durations["sql"] += time.perf_counter() - start
+
+    @contextmanager
+    def measure(self, kind):
+        self.depth[kind] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[kind] -= 1
+            if self.depth[kind] == 0:
+                self.durations[kind] += time.perf_counter() - start
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def current_timer():
+    return _current.get()
+
+
+def _execute(execute, sql, params, many, context):
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer.execute(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    # 连接对象按线程创建  重新连接时不重复安装
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+connection_created.connect(install, dispatch_uid="utils.timing.install")
+
+
+def install_all():
+    # 模块导入之前当前线程已经创建的连接
+    for connection in connections.all():
+        install(connection)
+
+
+@contextmanager
+def measure(kind):
+    """
+    记录当前请求中 kind(serialize / render) 的耗时  不在请求中时不做任何操作
+    """
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.measure(kind):
+        yield
+
+
+class TimedSerializerMixin(object):
+
+    def to_representation(self, instance):
+        with measure("serialize"):
+            return super().to_representation(instance)
+
+    def run_validation(self, *args, **kwargs):
+        with measure("serialize"):
+            return super().run_validation(*args, **kwargs)
+
+
+class TimedRendererMixin(object):
+
+    def render(self, *args, **kwargs):
+        with measure("render"):
+            return super().render(*args, **kwargs)
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+class RouteMetrics(object):
+    """
+    按 (路由, 方法, 状态码) 汇总的指标
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, method, status, timer, duration):
+        key = (route, method, status)
+        with self.lock:
+            item = self.routes.get(key)
+            if item is None:
+                item = self.routes[key] = {"count": 0, "duration": 0.0, "queries": 0,
+                                           "sql": 0.0, "serialize": 0.0, "render": 0.0,
+                                           "buckets": [0] * len(BUCKETS)}
+            item["count"] += 1
+            item["duration"] += duration
+            item["queries"] += timer.queries
+            for kind, value in timer.durations.items():
+                item[kind] += value
+            for index, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    item["buckets"][index] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {key: dict(item, buckets=list(item["buckets"])) for key, item in self.routes.items()}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+metrics = RouteMetrics()
+
+
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    # Django 2.2 以上可以拿到完整的路由  之前的版本使用视图名
+    return "/" + match.route if getattr(match, "route", None) else match.view_name
+
+
+def _query_budget(route):
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    return budgets.get(route, budgets.get("*"))
+
+
+class TimingMiddleware(object):
+    # 同时支持同步与异步  ASGI 部署时不会被放到线程池中执行
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # 与 MiddlewareMixin 一样标记为协程函数
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            install_all()
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process(request, response, timer)
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            install_all()
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process(request, response, timer)
+
+    def process(self, request, response, timer):
+        duration = timer.elapsed()
+        route = _route(request)
+        metrics.record(route, request.method, response.status_code, timer, duration)
+
+        budget = _query_budget(route)
+        if budget is not None and timer.queries > budget:
+            logger.warning("%s %s 执行了 %s 次查询  超过预算 %s 次", request.method, route, timer.queries, budget)
+
+        if getattr(settings, "SERVER_TIMING", True):
+            response["Server-Timing"] = ", ".join([
+                'db;dur=%.2f;desc="%s queries"' % (timer.durations["sql"] * 1000, timer.queries),
+                "serialize;dur=%.2f" % (timer.durations["serialize"] * 1000),
+                "render;dur=%.2f" % (timer.durations["render"] * 1000),
+                "total;dur=%.2f" % (duration * 1000),
+            ])
+        return response
+
+
+def _labels(**labels):
+    return ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for key, value in labels.items())
+
+
+def render_metrics():
+    """
+    Prometheus 文本格式
+    """
+    from utils.cache import get_response_cache
+
+    lines = []
+    snapshot = sorted(metrics.snapshot().items())
+    series = [
+        ("http_requests_total", "counter", "请求次数", "count"),
+        ("http_request_queries_total", "counter", "执行的 SQL 次数", "queries"),
+        ("http_request_sql_seconds_total", "counter", "SQL 耗时", "sql"),
+        ("http_request_serialize_seconds_total", "counter", "序列化耗时", "serialize"),
+        ("http_request_render_seconds_total", "counter", "渲染耗时", "render"),
+    ]
+    for name, kind, help_text, field in series:
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for (route, method, status), item in snapshot:
+            lines.append("%s{%s} %s" % (name, _labels(route=route, method=method, status=status), item[field]))
+
+    name = "http_request_duration_seconds"
+    lines.append("# HELP %s 请求总耗时" % name)
+    lines.append("# TYPE %s histogram" % name)
+    for (route, method, status), item in snapshot:
+        labels = _labels(route=route, method=method, status=status)
+        for bound, count in zip(BUCKETS, item["buckets"]):
+            lines.append('%s_bucket{%s,le="%s"} %s' % (name, labels, bound, count))
+        lines.append('%s_bucket{%s,le="+Inf"} %s' % (name, labels, item["count"]))
+        lines.append("%s_sum{%s} %s" % (name, labels, item["duration"]))
+        lines.append("%s_count{%s} %s" % (name, labels, item["count"]))
+
+    stats = get_response_cache().stats()
+    for name, kind, key in (("response_cache_hits_total", "counter", "hits"),
+                            ("response_cache_misses_total", "counter", "misses"),
+                            ("response_cache_size", "gauge", "size")):
+        lines.append("# TYPE %s %s" % (name, kind))
+        lines.append("%s %s" % (name, stats[key]))
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    # 只允许本机访问
+    if request.META.get("REMOTE_ADDR") not in getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1")):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
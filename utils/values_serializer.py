@@ -0,0 +1,179 @@
+"""
+基于 .values() 的只读快速序列化
+
+将 ModelSerializer 中声明的字段编译成一次 .values() 查询以及预先生成好的
+行 -> 字典 的转换函数  不再为每一行创建模型对象、逐个字段调用 get_attribute
+输出与原序列化器完全一致  只支持模型字段、外键、图片尺寸、嵌套的外键序列化器
+以及 source="*" 的嵌套序列化器(同一行的列)
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
+
+from utils.prefetch import setup_eager_loading
+from utils.renditions import RenditionField, rendition_urls
+from utils.timing import measure
+
+# 按序列化器类(或 plan_key)缓存编译结果  不支持快速序列化的记录为 None
+_compiled = {}
+
+
+def _resolve_column(model, attrs):
+    """
+    source_attrs -> values() 使用的列名以及列对应的模型字段
+    只允许经过正向的外键/一对一  最后是一个普通字段
+    """
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None, None
+        if index == len(attrs) - 1:
+            if field.many_to_many or field.one_to_many or (field.is_relation and field.auto_created):
+                return None, None
+            return "__".join(attrs), field
+        if not (field.many_to_one or field.one_to_one) or field.auto_created:
+            return None, None
+        model = field.related_model
+    return None, None
+
+
+def _compile(serializer, model, prefix, columns):
+    """
+    return: 转换函数 mapper(row, request) -> OrderedDict
+    """
+    converters = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        attrs = field.source_attrs
+        name = field.field_name
+
+        if isinstance(field, serializers.BaseSerializer) and not attrs and not isinstance(
+                field, serializers.ListSerializer):
+            # source="*"  使用同一行中的列
+            nested = _compile(field, model, prefix, columns)
+            converters.append((name, None, "inline", nested))
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            if isinstance(field, serializers.ListSerializer) or len(attrs) != 1:
+                raise TypeError("字段 %s 不支持快速序列化" % name)
+            related = model._meta.get_field(attrs[0])
+            if not (related.many_to_one or related.one_to_one) or related.auto_created:
+                raise TypeError("字段 %s 不支持快速序列化" % name)
+            # 通过外键的主键判断关联对象是否存在
+            key = prefix + attrs[0] + "__pk"
+            columns.append(key)
+            nested = _compile(field, related.related_model, prefix + attrs[0] + "__", columns)
+            converters.append((name, key, "nested", nested))
+            continue
+
+        column, model_field = _resolve_column(model, attrs)
+        if column is None:
+            raise TypeError("字段 %s 不支持快速序列化" % name)
+        column = prefix + column
+        columns.append(column)
+
+        if model_field.is_relation and not isinstance(field, PrimaryKeyRelatedField):
+            # 外键的其他表现形式需要关联对象本身
+            raise TypeError("字段 %s 不支持快速序列化" % name)
+
+        if isinstance(field, RenditionField):
+            converters.append((name, column, "renditions", model_field.storage))
+        elif isinstance(field, serializers.FileField):
+            converters.append((name, column, "file", (field, model_field.storage)))
+        elif isinstance(field, PrimaryKeyRelatedField):
+            converters.append((name, column, "pk", field))
+        else:
+            converters.append((name, column, "field", field))
+
+    def mapper(row, request):
+        ret = OrderedDict()
+        for name, column, kind, target in converters:
+            if kind == "inline":
+                ret[name] = target(row, request)
+                continue
+            value = row[column]
+            if value is None:
+                ret[name] = None
+            elif kind == "field":
+                ret[name] = target.to_representation(value)
+            elif kind == "pk":
+                ret[name] = target.to_representation(PKOnlyObject(pk=value))
+            elif kind == "nested":
+                ret[name] = target(row, request)
+            elif kind == "renditions":
+                ret[name] = rendition_urls(target, value, request)
+            else:
+                ret[name] = _file_url(target, value, request)
+        return ret
+
+    return mapper
+
+
+def _file_url(target, value, request):
+    # 与 DRF FileField.to_representation 的逻辑保持一致
+    field, storage = target
+    if not value:
+        return None
+    if not getattr(field, "use_url", True):
+        return value
+    url = storage.url(value)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class ValuesSerializer(object):
+    """
+    使用方法:
+        ValuesSerializer(BookModelSerializer).serialize(queryset, request=request)
+    也可以传入序列化器实例  使用实例裁剪后的字段(utils.dynamic_fields)
+    包含不支持的字段时抛出 TypeError
+    """
+
+    def __init__(self, serializer):
+        if isinstance(serializer, type):
+            key = serializer
+        else:
+            key = getattr(serializer, "plan_key", None)
+        if key is None or key not in _compiled:
+            if isinstance(serializer, type):
+                serializer = serializer()
+            columns = []
+            try:
+                mapper = _compile(serializer, serializer.Meta.model, "", columns)
+                # 去掉重复的列
+                compiled = (list(OrderedDict.fromkeys(columns)), mapper)
+            except TypeError:
+                compiled = None
+            if key is not None:
+                _compiled[key] = compiled
+        else:
+            compiled = _compiled[key]
+        if compiled is None:
+            raise TypeError("%s 不支持快速序列化" % type(serializer).__name__)
+        self.columns, self.mapper = compiled
+
+    def serialize(self, queryset, request=None):
+        mapper = self.mapper
+        rows = list(queryset.values(*self.columns))
+        with measure("serialize"):
+            return [mapper(row, request) for row in rows]
+
+
+def serialize(serializer, queryset, request=None):
+    """
+    优先使用快速序列化  字段不支持时(例如 ?expand= 展开的多对多)
+    添加关联加载后使用序列化器本身
+    serializer: 序列化器实例
+    """
+    try:
+        values = ValuesSerializer(serializer)
+    except TypeError:
+        queryset = setup_eager_loading(queryset, serializer)
+        return type(serializer)(queryset, many=True, context=serializer.context).data
+    return values.serialize(queryset, request=request)
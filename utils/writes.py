@@ -0,0 +1,39 @@
+"""
+记录当前请求中实际发生的写入
+
+DataVersion.bump 与写入在同一个事务中执行  调用 record_write 记录写入的表
+响应缓存(utils.cache)与读写分离的路由(utils.routers)根据它判断请求是否写入了数据
+    不能根据状态码判断  很多视图出错时也返回 200  错误信息在响应的内容中
+    写入的事务回滚时请求会以异常结束  不会按写入成功处理
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 当前请求写入的表  不在 track_writes 中时为 None
+_writes = ContextVar("request_writes", default=None)
+
+
+@contextmanager
+def track_writes():
+    """
+    with track_writes() as writes:
+        ...
+    if writes: 请求中写入了数据
+    嵌套使用时共用最外层的记录
+    """
+    writes = _writes.get()
+    if writes is not None:
+        yield writes
+        return
+    writes = []
+    token = _writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _writes.reset(token)
+
+
+def record_write(*tables):
+    writes = _writes.get()
+    if writes is not None:
+        writes.extend(tables)